@@ -3,9 +3,14 @@
 from __future__ import unicode_literals
 
 import bentoo.yaml
+import mmap
+import os
 import re
 import json
-from collections import OrderedDict
+
+# "//" line comments in jsonc files, strings are matched as a whole (group 1)
+# and kept, so "//" inside strings like urls is not taken as a comment.
+COMMENT_PTN = re.compile(br'("(?:\\.|[^"\\])*")|//[^\n]*')
 
 
 def load(fileobj, *args, **kwargs):
@@ -35,24 +40,31 @@ def load_conf(fn):
 
     This function parses a jsonc/yaml file. Unlike the builtin `json` module, it
     supports "//" like comments, uses 'str' for string representation and
-    preserves the key orders.
+    preserves the key orders (python dicts keep insertion order).
 
     Args:
         fn (str): Name of the file to parse.
 
     Returns:
-        OrderedDict: A dict representing the file content.
+        dict: A dict representing the file content.
 
     '''
     if fn.endswith(".json") or fn.endswith(".jsonc"):
         # json with "//" like line comments
-        content = open(fn).read()
-        content = re.sub(r"//.*$", "", content)
-        return json.loads(content, object_pairs_hook=OrderedDict)
+        with open(fn, "rb") as f:
+            if os.fstat(f.fileno()).st_size < mmap.PAGESIZE:
+                # mmap setup does not pay off for small files
+                content = COMMENT_PTN.sub(br"\1", f.read())
+            else:
+                # strip comments straight from the mapped file, saving a copy
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    content = COMMENT_PTN.sub(br"\1", mm)
+        return json.loads(content)
     elif fn.endswith(".yaml") or fn.endswith(".yml"):
         # yaml
         yaml = bentoo.yaml.YAML(pure=True)
         return yaml.load(fn)
     else:
         # default to regular json
-        return json.load(fn, object_pairs_hook=OrderedDict)
+        with open(fn) as f:
+            return json.load(f)
@@ -3,6 +3,30 @@
 
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads_json(data):
+    '''Parse json bytes, using orjson if possible'''
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            # orjson is strict, e.g., it rejects NaN written by json.dumps
+            pass
+    return json.loads(data)
+
+
+def load_json(fn):
+    '''Load a json file in one read'''
+    with open(fn, "rb") as f:
+        return loads_json(f.read())
+
 
 class TestProjectReader(object):
     '''Scan a test project for test cases'''
@@ -12,7 +36,7 @@ class TestProjectReader(object):
         conf_fn = os.path.join(self.project_root, "TestProject.json")
         if not os.path.exists(conf_fn):
             raise RuntimeError("Invalid project directory: %s" % project_root)
-        conf = json.load(open(conf_fn))
+        conf = load_json(conf_fn)
         version = conf.get("version", 1)
         if version != 1:
             raise RuntimeError("Unsupported project version '%s': Only 1 " %
@@ -21,11 +45,12 @@ class TestProjectReader(object):
         self.test_factors = conf["test_factors"]
         self.test_cases = conf["test_cases"]
         self.data_files = conf.get("data_files", [])
+        self.case_specs = None
 
         self.last_stats = None
         stats_fn = os.path.join(self.project_root, "run_stats.json")
         if os.path.exists(stats_fn):
-            self.last_stats = json.load(open(stats_fn))
+            self.last_stats = load_json(stats_fn)
 
     def check(self):
         '''Check project's validity
@@ -40,24 +65,49 @@ class TestProjectReader(object):
             This shall be refined in the future.
 
         '''
-        for k, v in self.test_cases.items():
-            case_fullpath = os.path.join(self.project_root, v)
-            if not os.path.exists(case_fullpath):
+        # Case directories are looked up in one listing of each parent
+        # directory, instead of one stat call per case, which is slow on
+        # network filesystems.
+        listings = {}
+
+        def list_dir(path):
+            if path not in listings:
+                try:
+                    listings[path] = set(e.name for e in os.scandir(path))
+                except OSError:
+                    listings[path] = set()
+            return listings[path]
+
+        for case in self.test_cases:
+            case_fullpath = os.path.join(self.project_root, case["path"])
+            parent, name = os.path.split(case_fullpath)
+            if name not in list_dir(parent):
                 raise RuntimeError("Test case '%s' not found in '%s'" %
-                                   (k, case_fullpath))
+                                   (case["path"], case_fullpath))
             case_spec_fullpath = os.path.join(case_fullpath, "TestCase.json")
             if not os.path.exists(case_spec_fullpath):
                 raise RuntimeError(
                     "Test case spec for '%s' is not found in '%s'" %
-                    (k, case_fullpath))
+                    (case["path"], case_fullpath))
             # TODO: check the content of case spec (better with json-schema)
 
+    def load_case_specs(self):
+        '''Load specifications of all test cases concurrently'''
+        case_spec_fullpaths = [
+            os.path.join(self.project_root, case["path"], "TestCase.json")
+            for case in self.test_cases
+        ]
+        with ThreadPoolExecutor() as executor:
+            return list(executor.map(load_json, case_spec_fullpaths))
+
     def itercases(self):
-        '''Build an iterator for all test cases'''
-        for case in self.test_cases:
-            case_spec_fullpath = os.path.join(self.project_root, case["path"],
-                                              "TestCase.json")
-            case_spec = json.load(open(case_spec_fullpath))
+        '''Build an iterator for all test cases
+
+        Case specifications are loaded on first use and cached afterwards.
+        '''
+        if self.case_specs is None:
+            self.case_specs = self.load_case_specs()
+        for case, case_spec in zip(self.test_cases, self.case_specs):
             yield {
                 "id": case["path"],
                 "path": case["path"],
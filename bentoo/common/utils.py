@@ -1,17 +1,42 @@
 # coding: utf-8
 
+import re
+import shutil
 import string
-import subprocess
 import os
+from functools import lru_cache
+
+# Characters that make a word need quoting in bash
+SHELL_SPECIAL_PTN = re.compile(r"[*?\[\]${}(); ]")
+
+
+@lru_cache(maxsize=1024)
+def make_template(template):
+    '''Make a string.Template, reused for templates seen recently'''
+    return string.Template(template)
 
 
 def replace_template(template, varvalues):
-    return string.Template(str(template)).safe_substitute(varvalues)
+    template = str(template)
+    # Nothing to substitute without placeholders
+    if "$" not in template:
+        return template
+    return make_template(template).safe_substitute(varvalues)
+
+
+@lru_cache(maxsize=4096)
+def compile_expr(expr):
+    '''Compile an expression, reused for expressions seen recently'''
+    # eval() ignores leading spaces and tabs of a string, do the same
+    return compile(expr.lstrip(" \t"), "<expr>", "eval")
 
 
 def safe_eval(expr):
+    # Integers evaluate to themselves, skip the round trip through str
+    if type(expr) is int or type(expr) is bool:
+        return expr
     try:
-        result = eval(str(expr))
+        result = eval(compile_expr(str(expr)))
     except ZeroDivisionError:
         result = 0
     except Exception:
@@ -19,21 +44,19 @@ def safe_eval(expr):
     return result
 
 
-def has_program(cmd):
-    '''Check if a program exists in $PATH'''
-    try:
-        subprocess.check_output(cmd, stderr=subprocess.STDOUT)
-        return True
-    except OSError:
-        return False
-    except subprocess.CalledProcessError:
-        return True
+@lru_cache(maxsize=None)
+def has_program(name):
+    '''Check if a program exists in $PATH
+
+    The program is looked up without being run, and the result is cached.
+    '''
+    return shutil.which(name) is not None
 
 
 def shell_quote(var):
     '''Quote a string so it appears as a whole in bash commands'''
     var = str(var)
-    if any(i in var for i in set("*?[]${}(); ")):
+    if SHELL_SPECIAL_PTN.search(var):
         return "\"%s\"" % var
     return var
 
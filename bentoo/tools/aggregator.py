@@ -23,11 +23,9 @@ import sqlite3
 SQLITE_TYPE = {
     type(None): "NULL",
     int: "INTEGER",
-    int: "INTEGER",
     float: "REAL",
     str: "TEXT",
-    str: "TEXT",
-    buffer: "BLOB"
+    bytes: "BLOB"
 }
 
 
@@ -112,14 +110,14 @@ def aggregate(input_db, output_db, on="thread"):
     sql = "CREATE TABLE result (%s)" % ", ".join(sql)
     conn1.execute(sql)
     conn1.commit()
-
-    for row in conn0.execute(select_sql).fetchall():
-        ph_sql = ", ".join(["?"] * len(row))
-        insert_row_sql = "INSERT INTO result VALUES ({0})".format(ph_sql)
-        conn1.execute(insert_row_sql, row)
-    conn1.commit()
-
     conn1.close()
+
+    # Aggregated rows go straight from the query into the attached output
+    # database, without being fetched into python.
+    conn0.execute("ATTACH DATABASE ? AS output", (output_db, ))
+    conn0.execute("INSERT INTO output.result {0}".format(select_sql))
+    conn0.commit()
+    conn0.execute("DETACH DATABASE output")
     conn0.close()
 
 
@@ -15,13 +15,13 @@ from builtins import range
 from past.utils import old_div
 from builtins import object
 import argparse
-import copy
 import json
 import fnmatch
 import hashlib
 import re
 
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from functools import reduce
 
 
@@ -145,10 +145,11 @@ class TreeNode(object):
         self.update_digest()
 
     def update_digest(self):
+        self.child_digests = tuple(c.digest for c in self.children)
         m = hashlib.md5()
-        m.update(str(self.id))
-        for c in self.children:
-            m.update(str(c.digest))
+        m.update(str(self.id).encode("utf-8"))
+        for d in self.child_digests:
+            m.update(d)
         self.digest = m.digest()
 
     def __repr__(self):
@@ -160,21 +161,28 @@ class TreeNode(object):
         return "\n".join(result)
 
     def __eq__(self, x):
-        return self.digest == x.digest
+        # Cheap identity, id and arity checks reject most mismatches before
+        # the digests are compared.
+        return self is x or (self.id == x.id
+                             and len(self.children) == len(x.children)
+                             and self.digest == x.digest)
 
     def __ne__(self, x):
-        return self.digest != x.digest
+        return not self == x
+
+    def __hash__(self):
+        return hash(self.digest)
 
     def __le__(self, x):
         if self.id != x.id:
             return False
-        me = [c.digest for c in self.children]
-        other = [c.digest for c in x.children]
+        other = x.child_digests
         index = 0
-        for item in me:
-            if item not in other[index:]:
+        for item in self.child_digests:
+            try:
+                index = other.index(item, index)
+            except ValueError:
                 return False
-            index = other.index(item, index)
         return True
 
     def __lt__(self, x):
@@ -185,13 +193,13 @@ class TreeNode(object):
     def __ge__(self, x):
         if self.id != x.id:
             return False
-        me = [c.digest for c in self.children]
-        other = [c.digest for c in x.children]
+        me = self.child_digests
         index = 0
-        for item in other:
-            if item not in me[index:]:
+        for item in x.child_digests:
+            try:
+                index = me.index(item, index)
+            except ValueError:
                 return False
-            index = me.index(item, index)
         return True
 
     def __gt__(self, x):
@@ -200,6 +208,13 @@ class TreeNode(object):
         return self <= x
 
 
+def is_same_children(tree, children):
+    '''Check if `children` are exactly the (unmodified) children of `tree`'''
+    if len(children) != len(tree.children):
+        return False
+    return all(a is b for a, b in zip(children, tree.children))
+
+
 def revert_unrolled_loop(callseq):
     if len(callseq) <= 1:
         return (callseq, False)
@@ -251,6 +266,8 @@ def prune_unrolled_loops(tree):
         return None
     children = [prune_unrolled_loops(c) for c in tree.children]
     new_children, _ = prune_unrolled_loop(children)
+    if is_same_children(tree, new_children):
+        return tree
     node = TreeNode(tree.id, tree.cycle)
     for c in new_children:
         node.append_child(c)
@@ -268,6 +285,8 @@ def remove_tree_nodes(tree, patterns):
         child = remove_tree_nodes(c, patterns)
         if child:
             children.append(child)
+    if is_same_children(tree, children):
+        return tree
     new_tree = TreeNode(tree.id, tree.cycle)
     for c in children:
         new_tree.append_child(c)
@@ -285,6 +304,8 @@ def remove_tree_levels(tree, max_level):
             child = remove_recursive(c, curr_level + 1, max_level)
             if child:
                 children.append(child)
+        if is_same_children(tree, children):
+            return tree
         new_tree = TreeNode(tree.id, tree.cycle)
         for c in children:
             new_tree.append_child(c)
@@ -329,19 +350,24 @@ def merge_repeative_calls(calls):
     return node
 
 
-def fold_tree(tree, cascade=False):
+def fold_tree(tree, cascade=False, jobs=1):
     def fold_tree_recursive(tree):
         if not tree:
             return None
         folded_children = []
         for c in tree.children:
             folded_children.append(fold_tree_recursive(c))
+        return merge_folded_children(tree, folded_children)
+
+    def merge_folded_children(tree, folded_children):
         new_children = []
         if folded_children:
             new_children = [folded_children[0]]
             for i in range(1, len(folded_children)):
                 if folded_children[i] != new_children[-1]:
                     new_children.append(folded_children[i])
+        if is_same_children(tree, new_children):
+            return tree
         new_tree = TreeNode(tree.id, tree.cycle)
         for c in new_children:
             new_tree.append_child(c)
@@ -381,6 +407,8 @@ def fold_tree(tree, cascade=False):
             for c in poss:
                 new_children.append(get_maximum(c))
 
+        if is_same_children(tree, new_children):
+            return tree
         new_tree = TreeNode(tree.id, tree.cycle)
         for c in new_children:
             new_tree.append_child(c)
@@ -392,6 +420,12 @@ def fold_tree(tree, cascade=False):
         except ValueError:
             resunt = tree
         return tree
+    elif jobs > 1 and tree and len(tree.children) > 1:
+        # Sibling subtrees fold independently, so fold them in parallel and
+        # merge the results at the root.
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            folded_children = list(executor.map(fold_tree, tree.children))
+        return merge_folded_children(tree, folded_children)
     else:
         return fold_tree_recursive(tree)
 
@@ -503,14 +537,21 @@ def main():
     grp = parser.add_mutually_exclusive_group()
     grp.add_argument("--fold", action="store_true", help="Fold tree")
     grp.add_argument("--cascade", action="store_true", help="Cascade tree")
+    parser.add_argument("--jobs",
+                        default=1,
+                        type=int,
+                        help="Fold top level subtrees in parallel using "
+                        "specified processes (default: 1)")
 
     args = parser.parse_args()
 
     if args.format == "json":
-        data = json.load(file(args.call_tree), object_hook=OrderedDict)
+        with open(args.call_tree) as f:
+            data = json.load(f, object_hook=OrderedDict)
         tree = TreeNode.deserialize(data)
     elif args.format == "ascii":
-        content = file(args.call_tree).read()
+        with open(args.call_tree) as f:
+            content = f.read()
         tree = TreeNode.from_ascii(content)
     else:
         raise ValueError("Unknown calltree file format: '%s'" % args.format)
@@ -528,10 +569,11 @@ def main():
     if args.prune_unrolled_loops:
         tree = prune_unrolled_loops(tree)
     if args.fold or args.cascade:
-        tree = fold_tree(tree, args.cascade)
+        tree = fold_tree(tree, args.cascade, args.jobs)
     if args.save:
         data = TreeNode.serialize(tree)
-        json.dump(data, file(args.save, "w"), indent=2)
+        with open(args.save, "w") as f:
+            json.dump(data, f, indent=2)
 
     if args.print_style == "plain":
         print_tree_plain(tree, args.print_depth)
@@ -118,7 +118,8 @@ def compute_percentage(ref_db, calltree_file, out_db,
     index_columns.remove(timer_column)
     data_columns.insert(0, timer_column)
 
-    calltree = json.load(file(calltree_file))
+    with open(calltree_file) as f:
+        calltree = json.load(f)
     timer_names = extract_timer_names(calltree)
 
     sql = list(map(quote, index_columns + data_columns + append_columns))
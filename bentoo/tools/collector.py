@@ -19,16 +19,20 @@ import argparse
 import csv
 import fnmatch
 import glob
-import io
+import itertools
 import json
+import mmap
 import os
 import re
 import sqlite3
 import string
 import sys
 import tarfile
-from collections import OrderedDict
-from functools import reduce
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache, reduce
+from operator import itemgetter
 
 from bentoo.common.project import TestProjectReader
 
@@ -57,28 +61,25 @@ class FnmatchFilter(object):
     def __init__(self, patterns, mode="include"):
         assert (mode in ("include", "exclude"))
         self.patterns = patterns
-
-        def match_any(path, patterns):
-            for m in patterns:
-                if fnmatch.fnmatch(path, m):
-                    return True
-            return False
+        # All patterns are matched at once by a single compiled regex.
+        self.union = re.compile("|".join(
+            fnmatch.translate(m) for m in patterns)) if patterns else None
 
         def null_check(path):
             return True
 
         def include_check(path):
-            return True if match_any(path, self.patterns) else False
+            return self.union.match(path) is not None
 
         def exclude_check(path):
-            return False if match_any(path, self.patterns) else True
+            return self.union.match(path) is None
 
         if not patterns:
             self.checker = null_check
         elif mode == "include":
-            self.checker = include_check
+            self.checker = lru_cache(maxsize=4096)(include_check)
         else:
-            self.checker = exclude_check
+            self.checker = lru_cache(maxsize=4096)(exclude_check)
 
     def valid(self, input):
         return self.checker(input)
@@ -132,6 +133,90 @@ class ResultScanner(object):
 #
 
 
+
+def map_file(fn):
+    '''Map a file read-only into memory
+
+    The returned buffer can be scanned by bytes regex patterns without reading
+    the whole file into a string. The mapping is released once it is no longer
+    referenced. Empty files can not be mapped, they are returned as b"".
+    '''
+    with open(fn, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def decode_groups(match, names):
+    '''Decode named groups of a bytes regex match to strings'''
+    return {k: match.group(k).decode("utf-8") for k in names}
+
+
+def iter_lines(buf, start, end):
+    '''Iterate over decoded lines of `buf[start:end]`
+
+    Lines are located with `bytes.find`, so the region is never copied or
+    split as a whole. A trailing newline does not give an extra empty line.
+    '''
+    while start < end:
+        pos = buf.find(b"\n", start, end)
+        if pos < 0:
+            pos = end
+        yield buf[start:pos].decode("utf-8")
+        start = pos + 1
+
+
+def append_column(name, header, col_index, rows):
+    '''Append a column to a table under construction
+
+    The column is registered in `col_index` and every existing row is padded
+    with None, so all rows keep the same length as `header`.
+    '''
+    col_index[name] = len(header)
+    header.append(name)
+    for row in rows:
+        row.append(None)
+
+
+def list_getter(indices):
+    '''Make a function picking items at `indices` from a row into a list
+
+    The items are gathered by operator.itemgetter in C, which beats a list
+    comprehension over the indices. Its scalar result for a single index is
+    taken care of.
+    '''
+    if not indices:
+        return lambda row: []
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda row: [row[index]]
+    getter = itemgetter(*indices)
+    return lambda row: list(getter(row))
+
+
+# Regex patterns used by jasmin log parsers, compiled once at import. Table
+# patterns are bytes patterns to scan memory mapped log files.
+FLOAT_PTN = r"[-+]?(?:\d+(?:\.\d*)?)(?:[Ee][-+]?\d+)?"
+JASMIN3_TABLE_PTN = re.compile(
+    br"^\+{80}$(?P<name>.*?)^\+{80}$" + br".*?(?P<header>^.*?$)" +
+    br"(?P<content>.*?)^\+{80}$", re.M + re.S)
+JASMIN3_HEADER_PTN = re.compile(r"(Timer Name|Proc: \d+|Summed|Proc|Max)")
+JASMIN3_SEGMENT_PTN = re.compile(r"({0})\s*(\({0}%\))?".format(FLOAT_PTN))
+JASMIN4_TABLE_PTN = re.compile(
+    br"^\*+ (?P<name>.*?) \*+$\n-{10,}\n" +
+    br"^(?P<header>^.*?$)\n-{10,}\n" + br"(?P<content>.*?)^-{10,}\n",
+    re.M + re.S)
+
+# Characters not allowed in tokens, they are treated as word separators.
+TOKEN_SEPARATORS = {ord(c): " " for c in ":-+*/#\n"}
+
+
+@lru_cache(maxsize=1024)
+def tokenlize(s):
+    '''Convert string into a valid lower case pythonic token'''
+    return "_".join(s.translate(TOKEN_SEPARATORS).lower().split())
+
+
 def parse_jasminlog(fn, use_table=None):
     '''parse_jasminlog - jasmin time manager log parser
 
@@ -160,13 +245,6 @@ def parse_jasminlog(fn, use_table=None):
     5.14626
 
     '''
-    def tokenlize(s):
-        '''Convert string into a valid lower case pythonic token'''
-        invalid_chars = r"[:-+*/#\n]"
-        return "_".join(
-            map(lambda x: x.lower(),
-                re.sub(invalid_chars, " ", s).split()))
-
     avail_types = {
         "TimerName": str,
         "proc_0": float,
@@ -179,12 +257,9 @@ def parse_jasminlog(fn, use_table=None):
     }
 
     table_id = 0
-    content = open(fn, "r").read()
-    logtbl_ptn = re.compile(
-        r"^\+{80}$(?P<name>.*?)^\+{80}$" + ".*?(?P<header>^.*?$)" +
-        r"(?P<content>.*?)^\+{80}$", re.M + re.S)
-    for match in logtbl_ptn.finditer(content):
-        log_table = match.groupdict()
+    content = map_file(fn)
+    for match in JASMIN3_TABLE_PTN.finditer(content):
+        log_table = decode_groups(match, ("name", "header"))
         table_name = tokenlize(log_table["name"])
         # We only handle table "TOTAL WALLCLOCK TIME"
         if table_name != "total_wallclock_time":
@@ -193,39 +268,45 @@ def parse_jasminlog(fn, use_table=None):
         if use_table and table_id not in use_table:
             continue
         # Extract table header
-        header_ptn = re.compile(r"(Timer Name|Proc: \d+|Summed|Proc|Max)")
-        header = list(map(tokenlize, header_ptn.findall(log_table["header"])))
+        header = list(
+            map(tokenlize, JASMIN3_HEADER_PTN.findall(log_table["header"])))
         assert (header[0] == "timer_name")
         header[0] = "TimerName"
-        # Parse table rows
-        table_contents = []
-        for ln in log_table["content"].strip().split("\n"):
-            rec_ptn = re.compile(r"^\s*(TOTAL RUN TIME:|\S+)\s*(.*)$")
-            tl, tr = rec_ptn.search(ln).groups()
-            timer_name = tl.strip()
-            if timer_name == "TOTAL RUN TIME:":
+        value_columns = header[1:]
+        col_index = {k: i for i, k in enumerate(header)}
+        # Parse table rows, XX% records are appended to the header as new
+        # columns when first seen.
+        data = []
+        for ln in iter_lines(content, *match.span("content")):
+            ln = ln.strip()
+            # skip empty lines
+            if not ln:
+                continue
+            # Timer names contain no spaces, except for "TOTAL RUN TIME:"
+            if ln.startswith("TOTAL RUN TIME:"):
                 timer_name = "TOTAL_RUN_TIME"
-            timer_rec = {"TimerName": avail_types["TimerName"](timer_name)}
-            flt_ptn = r"[-+]?(?:\d+(?:\.\d*)?)(?:[Ee][-+]?\d+)?"
-            seg_ptn = re.compile(r"({0})\s*(\({0}%\))?".format(flt_ptn))
-            for i, seg in enumerate(seg_ptn.finditer(tr)):
+                tr = ln[len("TOTAL RUN TIME:"):]
+            else:
+                fields = ln.split(None, 1)
+                timer_name = fields[0]
+                tr = fields[1] if len(fields) > 1 else ""
+            row = [None] * len(header)
+            row[0] = avail_types["TimerName"](timer_name)
+            data.append(row)
+            for i, seg in enumerate(JASMIN3_SEGMENT_PTN.finditer(tr)):
                 # Example: 99.9938 (97%)
                 a, b = seg.groups()
-                cn = header[i + 1]
-                timer_rec[cn] = avail_types[cn](a)
+                cn = value_columns[i]
+                row[col_index[cn]] = avail_types[cn](a)
                 if b:
                     pn = "{0}_percent".format(cn)
-                    timer_rec[pn] = avail_types[pn](b[1:-2]) * 0.01
-            table_contents.append(timer_rec)
-        # Fix table header when there are XX% records
-        for k in table_contents[0].keys():
-            if k not in header:
-                header.append(k)
+                    if pn not in col_index:
+                        append_column(pn, header, col_index, data)
+                    row[col_index[pn]] = avail_types[pn](b[1:-2]) * 0.01
         # Make final result:
         # Ensures `len(header) == len(types)` and `[len(data_item) ==
         # len(header) for data_item in data]`. So the data is in good shape.
         types = [avail_types[x] for x in header]
-        data = [[v.get(k, None) for k in header] for v in table_contents]
         table = {
             "table_id": table_id,
             "column_names": header,
@@ -306,63 +387,62 @@ def parse_jasmin4log(fn, use_table=None):
     }
 
     table_id = 0
-    content = open(fn, "r").read()
-    logtbl_ptn = re.compile(
-        r"^\*+ (?P<name>.*?) \*+$\n-{10,}\n" +
-        r"^(?P<header>^.*?$)\n-{10,}\n" + r"(?P<content>.*?)^-{10,}\n",
-        re.M + re.S)
-    for match in logtbl_ptn.finditer(content):
+    content = map_file(fn)
+    for match in JASMIN4_TABLE_PTN.finditer(content):
         # skipping tables not wanted, but null use_table means use all tables
         if use_table and table_id not in use_table:
             continue
-        # TODO: use column width to better split columns. the columns names and
-        # width can be determined from the header, everything is right aligned.
-        log_table = match.groupdict()
+        log_table = decode_groups(match, ("header", ))
         # Extract table header
         header = log_table["header"].split()
         assert (header[0] == "Name")
         header[0] = "TimerName"
         timer_name_pos = log_table["header"].index("Name")
         timer_value_pos = timer_name_pos + len("Name")
-        # Parse table rows
-        table_contents = []
-        for ln in log_table["content"].split("\n"):
+        value_columns = header[1:]
+        # Everything is right aligned, so each value column spans from the end
+        # of the previous column name to the end of its own name.
+        spans = []
+        pos = timer_value_pos
+        for cn in value_columns:
+            end = log_table["header"].index(cn, pos) + len(cn)
+            spans.append((pos, end))
+            pos = end
+        if spans:
+            spans[-1] = (spans[-1][0], None)
+        value_types = [avail_types.get(x, str) for x in value_columns]
+        col_index = {k: i for i, k in enumerate(header)}
+        # Parse table rows, XX% records are appended to the header as new
+        # columns when first seen.
+        data = []
+        for ln in iter_lines(content, *match.span("content")):
             # skip empty lines
             if not ln.strip():
                 continue
-            timer_rec = {}
             # split out the timer name column first, it may contain strange
             # charactors such as spaces.
             timer_name = ln[:timer_value_pos]
-            timer_rec["TimerName"] = timer_name.strip()
-            timer_values = ln[timer_value_pos:]
-            seg_ptn = re.compile(r"(\S+)")
-            for i, seg in enumerate(seg_ptn.finditer(timer_values)):
-                cn = header[i + 1]
-                val = seg.group(1)
-                flt_ptn = r"[-+]?(?:\d+(?:\.\d*)?)(?:[Ee][-+]?\d+)?|[+-]?nan"
-                m = re.match(r"({0})\(({0})%\)".format(flt_ptn), val)
-                if m:
+            row = [None] * len(header)
+            row[0] = timer_name.strip()
+            data.append(row)
+            if any(ln[a:a + 1].strip() for a, _ in spans):
+                # some value overflows its column, split by whitespace instead
+                tokens = ln[timer_value_pos:].split()
+            else:
+                tokens = [ln[a:b].strip() for a, b in spans]
+            values = parse_jasmin4_values(tokens, value_types)
+            for i, (val, percent) in enumerate(values):
+                cn = value_columns[i]
+                row[col_index[cn]] = val
+                if percent is not None:
                     pn = "{0}_percent".format(cn)
-                    a, b = list(map(float, [m.group(1), m.group(2)]))
-                    b = b * 0.01
-                    timer_rec[cn], timer_rec[pn] = a, b
-                    continue
-                m = re.match(r"({0})%".format(flt_ptn), val)
-                if m:
-                    timer_rec[cn] = float(m.group(1)) * 0.01
-                    continue
-                timer_rec[cn] = avail_types[cn](val)
-            table_contents.append(timer_rec)
-        # Fix table header when there are XX% records
-        for k in table_contents[0].keys():
-            if k not in header:
-                header.append(k)
+                    if pn not in col_index:
+                        append_column(pn, header, col_index, data)
+                    row[col_index[pn]] = percent
         # Make final result
         # Ensures `len(header) == len(types)` and `[len(data_item) ==
         # len(header) for data_item in data]`. So the data is in good shape.
         types = [avail_types.get(x, str) for x in header]
-        data = [[v.get(k, None) for k in header] for v in table_contents]
         table = {
             "table_id": table_id,
             "column_names": header,
@@ -374,6 +454,45 @@ def parse_jasmin4log(fn, use_table=None):
         table_id += 1
 
 
+def parse_jasmin4_values(tokens, types):
+    '''Parse value fields of a jasmin 4.0 timer record
+
+    Returns a `(value, percent)` pair for each field. Fields are converted by
+    the corresponding entry of `types` when possible. Otherwise fields like
+    "0.86(95.14%)" give the value and the percent as a fraction, and fields
+    like "95.14%" give the fraction as value. Empty fields give None values.
+    `percent` is None when absent.
+    '''
+    result = []
+    for i, token in enumerate(tokens):
+        convert = types[i]
+        if not token:
+            result.append((None, None))
+            continue
+        if convert is not str:
+            try:
+                result.append((convert(token), None))
+                continue
+            except ValueError:
+                pass
+        if token.endswith("%)"):
+            value, sep, percent = token[:-2].partition("(")
+            if sep:
+                try:
+                    result.append((float(value), float(percent) * 0.01))
+                    continue
+                except ValueError:
+                    pass
+        elif token.endswith("%"):
+            try:
+                result.append((float(token[:-1]) * 0.01, None))
+                continue
+            except ValueError:
+                pass
+        result.append((convert(token), None))
+    return result
+
+
 class Jasmin4Parser(object):
     @staticmethod
     def register_cmd_args(argparser):
@@ -410,35 +529,29 @@ class UnifiedJasminParser(object):
 
     def __init__(self, use_table, args):
         self.use_table = use_table
-        jasmin4_ptn = re.compile(
-            r"^\*+ (?P<name>.*?) \*+$\n-{10,}\n" +
-            r"^(?P<header>^.*?$)\n-{10,}\n" + r"(?P<content>.*?)^-{10,}\n",
-            re.M + re.S)
-        jasmin3_ptn = re.compile(
-            r"^\+{80}$(?P<name>.*?)^\+{80}$" + ".*?(?P<header>^.*?$)" +
-            r"(?P<content>.*?)^\+{80}$", re.M + re.S)
-
-        def detector(fn):
-            content = open(fn).read()
-            if jasmin3_ptn.search(content):
-                return "jasmin3"
-            elif jasmin4_ptn.search(content):
-                return "jasmin4"
-            else:
-                return "null"
-
-        def null_parse(fn, use_table):
-            # return + yield makes a perfect empty generator function
-            return
-            yield
-
-        self.filetype_detector = detector
         self.parser_funcs = {
             "jasmin3": parse_jasminlog,
             "jasmin4": parse_jasmin4log,
-            "null": null_parse
+            "null": UnifiedJasminParser.null_parse
         }
 
+    @staticmethod
+    def filetype_detector(fn):
+        '''Detect file types with the table patterns of the parsers'''
+        content = map_file(fn)
+        if JASMIN3_TABLE_PTN.search(content):
+            return "jasmin3"
+        elif JASMIN4_TABLE_PTN.search(content):
+            return "jasmin4"
+        else:
+            return "null"
+
+    @staticmethod
+    def null_parse(fn, use_table=None):
+        # return + yield makes a perfect empty generator function
+        return
+        yield
+
     def itertables(self, fn):
         filetype = self.filetype_detector(fn)
         tables = [t for t in self.parser_funcs[filetype](fn)]
@@ -458,22 +571,38 @@ class UnifiedJasminParser(object):
 #
 
 
-class BlockReader(object):
-    def __init__(self, start, end, use_regex=False):
-        if use_regex:
-            self.start_ = re.compile(start)
+def skip_last(iterable):
+    '''Iterate over all but the last item of an iterable'''
+    iterable = iter(iterable)
+    for prev in iterable:
+        for item in iterable:
+            yield prev
+            prev = item
 
-            def match_start(x):
-                return self.start_.match(x)
 
-            self.match_start = match_start
+def project_csv(reader, fieldnames, columns):
+    '''Iterate over csv records projected onto the given columns
 
-            self.end = re.compile(end)
+    Columns are picked by position, so no dict is built per record. Blank
+    records are skipped and missing fields are None, as csv.DictReader does.
+    '''
+    pick = list_getter([fieldnames.index(x) for x in columns])
+    width = len(fieldnames)
+    for record in reader:
+        if not record:
+            continue
+        if len(record) < width:
+            record.extend([None] * (width - len(record)))
+        yield pick(record)
 
-            def match_end(x):
-                return self.end_.match(x)
 
-            self.match_end = match_end
+class BlockReader(object):
+    def __init__(self, start, end, use_regex=False):
+        if use_regex:
+            self.start_ = re.compile(start)
+            self.end_ = re.compile(end)
+            self.match_start = self.start_.match
+            self.match_end = self.end_.match
         else:
 
             def match_start(x):
@@ -488,28 +617,40 @@ class BlockReader(object):
             self.match_end = match_end
 
     def iterblocks(self, iterable):
-        while True:
-            try:
-                block = []
-                while not self.match_start(next(iterable)):
-                    continue
-                line = next(iterable)
-                while not self.match_end(line):
-                    block.append(line)
-                    line = next(iterable)
-                yield block
-            except StopIteration:
+        '''Iterate over blocks, each block is a lazy iterator of its lines
+
+        Blocks share the underlying iterator, so a block shall be consumed
+        before advancing to the next one. Unconsumed lines are skipped.
+        '''
+        iterable = iter(iterable)
+        for line in iterable:
+            if self.match_start(line):
+                yield self.iterlines(iterable)
+
+    def iterlines(self, iterable):
+        for line in iterable:
+            if self.match_end(line):
                 return
+            yield line
 
     def findblock(self, iterable):
-        block = []
-        while not self.match_start(next(iterable)):
-            continue
-        line = next(iterable)
-        while not self.match_end(line):
-            block.append(line)
-            line = next(iterable)
-        return block
+        return list(next(self.iterblocks(iterable)))
+
+
+def zip_blocks(iterblocks, paths):
+    '''Iterate over the i-th blocks of all files together
+
+    All files shall hold the same number of blocks, a file running out of
+    blocks before the others raises RuntimeError instead of silently dropping
+    the extra blocks of the other files.
+    '''
+    missing = object()
+    for blocks in itertools.zip_longest(*iterblocks, fillvalue=missing):
+        if any(block is missing for block in blocks):
+            short = [p for p, b in zip(paths, blocks) if b is missing]
+            raise RuntimeError("Data file '%s' has fewer blocks than others" %
+                               short[0])
+        yield blocks
 
 
 class LikwidBlockParser(object):
@@ -528,27 +669,26 @@ class LikwidBlockParser(object):
         next(iterable)
         line2 = next(iterable)
         cpu_cycles = float(line2.split(":")[-1].strip())
-        other = [x for x in iterable]
-        other = io.StringIO("".join(other[1:-1]))
-        likwid_data = csv.DictReader(other)
+        # Skip the blank line after the header and the trailing line.
+        next(iterable)
+        likwid_data = csv.reader(skip_last(iterable))
+        fieldnames = next(likwid_data)
         # NOTE: likwid output use RegionTag as TimerName, as well as a
         # different order. We fix it here.
         start_columns = "ThreadId,TimerName,time,CallCount,inverseClock".split(
             ",")
         self.column_names.extend(start_columns)
         self.column_types.extend([int, str, float, int, float])
-        other_columns = list(likwid_data.fieldnames[4:])
+        other_columns = list(fieldnames[4:])
         other_columns = [x for x in other_columns if x]
         self.column_names.extend(other_columns)
         self.column_types.extend([float] * len(other_columns))
+        columns = ["ThreadId", "RegionTag", "RDTSC", "CallCount"]
+        inverse_clock = 1.0 / cpu_cycles
         self.data = []
-        for record in likwid_data:
-            result = [
-                record["ThreadId"], record["RegionTag"], record["RDTSC"],
-                record["CallCount"]
-            ]
-            result.append(1.0 / cpu_cycles)
-            result.extend(record[f] for f in other_columns)
+        for result in project_csv(likwid_data, fieldnames,
+                                  columns + other_columns):
+            result.insert(4, inverse_clock)
             self.data.append(result)
 
 
@@ -580,40 +720,39 @@ class LikwidParser(object):
             print("WARNING: No likwid data file found in '%s'" % result_dir)
             return
 
-        files = [open(path) for path in likwid_data]
-
         parser = LikwidBlockParser()
         likwid_block = BlockReader("@start_likwid\n", "@end_likwid\n")
-        # Count blocks to ease table_id generating
-        nblocks = len(list(likwid_block.iterblocks(files[0])))
-        if nblocks == 0:
-            print("WARNING: No likwid data table found in '%s'" %
-                  likwid_data[0])
-            return
-        # Reset files[0] as iterblocks have already arrive eof.
-        files[0] = open(likwid_data[0])
-
+        proc_ids = [
+            int(os.path.basename(path).split(".")[1]) for path in likwid_data
+        ]
+        # Read the i-th block of every file together, so each file is only
+        # scanned once.
         all_tables = []
-        for table_id in range(nblocks):
-            data = []
-            for i, f in enumerate(files):
-                proc_id = int(os.path.basename(likwid_data[i]).split(".")[1])
-                block = likwid_block.findblock(f)
-                assert (block)
-                parser.process(iter(block))
-                for d in parser.data:
-                    data.append([proc_id] + d)
-            cn = ["ProcId"] + parser.column_names
-            ct = [int] + parser.column_types
-            all_tables.append({
-                "table_id": table_id,
-                "column_names": cn,
-                "column_types": ct,
-                "data": data
-            })
+        with ExitStack() as stack:
+            files = [
+                stack.enter_context(open(path, buffering=1 << 16))
+                for path in likwid_data
+            ]
+            iterblocks = [likwid_block.iterblocks(f) for f in files]
+            for table_id, blocks in enumerate(
+                    zip_blocks(iterblocks, likwid_data)):
+                data = []
+                for proc_id, block in zip(proc_ids, blocks):
+                    parser.process(block)
+                    for d in parser.data:
+                        data.append([proc_id] + d)
+                cn = ["ProcId"] + parser.column_names
+                ct = [int] + parser.column_types
+                all_tables.append({
+                    "table_id": table_id,
+                    "column_names": cn,
+                    "column_types": ct,
+                    "data": data
+                })
 
         if not all_tables:
-            yield
+            print("WARNING: No likwid data table found in '%s'" %
+                  likwid_data[0])
             return
         if self.use_table:
             for i in self.use_table:
@@ -636,21 +775,17 @@ class UdcBlockParser(object):
 
     def process(self, iterable):
         self.clear()
-        content = [x for x in iterable]
-        content = io.StringIO("".join(content))
-        data = csv.DictReader(content)
+        data = csv.reader(iterable)
+        fieldnames = next(data)
         start_columns = "ThreadId,TimerName".split(",")
         self.column_names.extend(start_columns)
         self.column_types.extend([int, str])
-        other_columns = list(data.fieldnames[2:])
+        other_columns = list(fieldnames[2:])
         other_columns = [x for x in other_columns if x]
         self.column_names.extend(other_columns)
         self.column_types.extend([float] * len(other_columns))
-        self.data = []
-        for record in data:
-            result = [record["ThreadId"], record["TimerName"]]
-            result.extend(record[f] for f in other_columns)
-            self.data.append(result)
+        self.data = list(
+            project_csv(data, fieldnames, start_columns + other_columns))
 
 
 class UdcParser(object):
@@ -682,39 +817,38 @@ class UdcParser(object):
             print("WARNING: No data file found in '%s'" % result_dir)
             return
 
-        files = [open(path) for path in udc_data]
-
         parser = UdcBlockParser()
         block_reader = BlockReader("@start_udc\n", "@end_udc\n")
-        # Count blocks to ease table_id generating
-        nblocks = len(list(block_reader.iterblocks(files[0])))
-        if nblocks == 0:
-            print("WARNING: No udc data table found in '%s'" % udc_data[0])
-            return
-        # Reset files[0] as iterblocks have already arrive eof.
-        files[0] = open(udc_data[0])
-
+        proc_ids = [
+            int(os.path.basename(path).split(".")[1]) for path in udc_data
+        ]
+        # Read the i-th block of every file together, so each file is only
+        # scanned once.
         all_tables = []
-        for table_id in range(nblocks):
-            data = []
-            for i, f in enumerate(files):
-                proc_id = int(os.path.basename(udc_data[i]).split(".")[1])
-                block = block_reader.findblock(f)
-                assert (block)
-                parser.process(iter(block))
-                for d in parser.data:
-                    data.append([proc_id] + d)
-            cn = ["ProcId"] + parser.column_names
-            ct = [int] + parser.column_types
-            all_tables.append({
-                "table_id": table_id,
-                "column_names": cn,
-                "column_types": ct,
-                "data": data
-            })
+        with ExitStack() as stack:
+            files = [
+                stack.enter_context(open(path, buffering=1 << 16))
+                for path in udc_data
+            ]
+            iterblocks = [block_reader.iterblocks(f) for f in files]
+            for table_id, blocks in enumerate(
+                    zip_blocks(iterblocks, udc_data)):
+                data = []
+                for proc_id, block in zip(proc_ids, blocks):
+                    parser.process(block)
+                    for d in parser.data:
+                        data.append([proc_id] + d)
+                cn = ["ProcId"] + parser.column_names
+                ct = [int] + parser.column_types
+                all_tables.append({
+                    "table_id": table_id,
+                    "column_names": cn,
+                    "column_types": ct,
+                    "data": data
+                })
 
         if not all_tables:
-            yield
+            print("WARNING: No udc data table found in '%s'" % udc_data[0])
             return
         if self.use_table:
             for i in self.use_table:
@@ -1034,23 +1168,25 @@ class SqliteSerializer(object):
     typemap = {
         type(None): "NULL",
         int: "INTEGER",
-        int: "INTEGER",
         float: "REAL",
         str: "TEXT",
-        str: "TEXT",
         bytes: "BLOB"
     }
 
     @staticmethod
     def register_cmd_args(argparser):
-        pass
+        argparser.add_argument("--sqlite-batch-size",
+                               default=10000,
+                               type=int,
+                               help="Rows inserted per transaction")
 
     @staticmethod
     def retrive_cmd_args(namespace):
-        return {}
+        return {"batch_size": namespace.sqlite_batch_size}
 
     def __init__(self, dbfile, args):
         self.dbfile = dbfile
+        self.batch_size = args.get("batch_size", 10000)
 
     def serialize(self, data_items, column_names, column_types):
         '''Dump content to database
@@ -1071,14 +1207,30 @@ class SqliteSerializer(object):
             create_columns_sql)
         ph_sql = ", ".join(["?"] * len(column_names))
         insert_row_sql = "INSERT INTO result VALUES ({0})".format(ph_sql)
-        # Create table and insert data items
+        # Check the shape of the first item only, sqlite checks that each
+        # item matches the placeholders.
+        data_items = iter(data_items)
+        first = next(data_items, None)
+        if first is not None:
+            assert isinstance(first, (list, tuple))
+            assert len(first) == len(column_names)
+            data_items = itertools.chain([first], data_items)
+        # Create table and insert data items in batches, one transaction per
+        # batch keeps the in memory journal small. The result file is written
+        # from scratch, so the rollback journal is kept in memory and syncs are
+        # skipped, as in metric.py, leaving no journal files besides the db.
         cur = self.conn.cursor()
+        cur.execute("PRAGMA journal_mode=MEMORY")
+        cur.execute("PRAGMA synchronous=OFF")
+        cur.execute("PRAGMA cache_size=-64000")
         cur.execute(create_table_sql)
-        for item in data_items:
-            assert isinstance(item, list) or isinstance(item, tuple)
-            assert len(item) == len(column_names)
-            cur.execute(insert_row_sql, item)
-        self.conn.commit()
+        while True:
+            batch = list(itertools.islice(data_items, self.batch_size))
+            if not batch:
+                break
+            cur.execute("BEGIN")
+            cur.executemany(insert_row_sql, batch)
+            self.conn.commit()
         self.conn.close()
 
 
@@ -1089,29 +1241,99 @@ class PandasSerializer(object):
                                default="xlsx",
                                choices=("xls", "xlsx", "csv"),
                                help="Output file format")
+        argparser.add_argument("--pandas-chunksize",
+                               default=100000,
+                               type=int,
+                               help="Rows per DataFrame when writing excel "
+                               "files with pandas")
 
     @staticmethod
     def retrive_cmd_args(namespace):
-        return {"format": namespace.pandas_format}
+        return {
+            "format": namespace.pandas_format,
+            "chunksize": namespace.pandas_chunksize
+        }
 
     def __init__(self, data_file, args):
         self.data_file = data_file
         self.file_format = args["format"]
+        self.chunksize = args.get("chunksize", 100000)
+
+    # pandas dtypes for column types, nullable integers allow missing values.
+    dtypemap = {int: "Int64", float: "float64"}
 
     def serialize(self, data_items, column_names, column_types):
-        import numpy
-        import pandas
-        # column_types is not used becuase numpy automatically deduce the best
-        # type for each data item.
-        data = numpy.array(list(data_items))
-        frame = pandas.DataFrame(data, columns=column_names)
-        if self.file_format == "xls" or self.file_format == "xlsx":
-            frame.to_excel(self.data_file, index=False)
-        elif self.file_format == "csv":
-            frame.to_csv(self.data_file, index=False)
-        else:
+        if self.file_format == "csv":
+            # csv needs no type information, so rows are streamed directly.
+            with open(self.data_file, "w", newline="") as f:
+                writer = csv.writer(f, lineterminator="\n")
+                writer.writerow(column_names)
+                writer.writerows(data_items)
+            return
+        if self.file_format not in ("xls", "xlsx"):
             raise RuntimeError("Unsupported output format '%s'" %
                                self.file_format)
+        if self.file_format == "xlsx":
+            try:
+                import xlsxwriter
+            except ImportError:
+                pass
+            else:
+                self.write_xlsx(xlsxwriter, data_items, column_names,
+                                column_types)
+                return
+        import pandas
+        # Build one DataFrame per chunk of rows, so only a chunk of rows is
+        # held by pandas at a time.
+        data_items = iter(data_items)
+        startrow = 0
+        with pandas.ExcelWriter(self.data_file) as writer:
+            while True:
+                chunk = list(itertools.islice(data_items, self.chunksize))
+                if startrow and not chunk:
+                    break
+                frame = pandas.DataFrame.from_records(chunk,
+                                                      columns=column_names)
+                for name, t in zip(column_names, column_types):
+                    if t in PandasSerializer.dtypemap:
+                        frame[name] = pandas.to_numeric(frame[name]).astype(
+                            PandasSerializer.dtypemap[t])
+                frame.to_excel(writer,
+                               index=False,
+                               header=not startrow,
+                               startrow=startrow + 1 if startrow else 0)
+                startrow += len(chunk)
+                if len(chunk) < self.chunksize:
+                    break
+
+    def write_xlsx(self, xlsxwriter, data_items, column_names, column_types):
+        '''Stream rows to a xlsx file without building a DataFrame
+
+        xlsxwriter in constant memory mode flushes each row once the next one
+        is started, which is why rows are written here in order instead of
+        through pandas, as pandas writes excel files column by column.
+        '''
+        numeric = [
+            i for i, t in enumerate(column_types)
+            if t in PandasSerializer.dtypemap
+        ]
+        workbook = xlsxwriter.Workbook(self.data_file, {
+            "constant_memory": True,
+            "nan_inf_to_errors": True
+        })
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, column_names)
+        for row, item in enumerate(data_items, 1):
+            item = list(item)
+            for i in numeric:
+                value = item[i]
+                if isinstance(value, str):
+                    # pandas.to_numeric takes empty strings as nan
+                    value = column_types[i](value) if value else None
+                # write nan as empty cells, the same as pandas
+                item[i] = None if value != value else value
+            worksheet.write_row(row, 0, item)
+        workbook.close()
 
 
 class SerializerFactory(object):
@@ -1158,6 +1380,12 @@ class DataAggregator(object):
         self.filter = FnmatchFilter(column_filter, filter_mode)
 
     def aggregate(self, tables):
+        '''Aggregate data tables into a single table
+
+        All tables shall share the same structure, i.e., the same id keys and
+        the same column names and types. The column types are thus taken from
+        the first table and reused for all the others.
+        '''
         if type(tables) is list:
             tables = iter(tables)
         # Probe table structure
@@ -1169,41 +1397,104 @@ class DataAggregator(object):
 
         table_id = first_table["id"]
         table_content = first_table["content"]
-        all_names = list(table_id.keys()) + table_content["column_names"]
-        all_types = [type(x) for x in list(table_id.values())]
+        id_names = list(table_id.keys())
+        data_names = table_content["column_names"]
+        all_names = id_names + data_names
+        all_types = [type(x) for x in table_id.values()]
         all_types.extend(table_content["column_types"])
 
         ds = [i for i, n in enumerate(all_names) if self.filter.valid(n)]
         column_names = [all_names[i] for i in ds]
         column_types = [all_types[i] for i in ds]
-
-        def data_generator():
-            table_id = first_table["id"]
-            for item in first_table["content"]["data"]:
-                all_values = list(table_id.values()) + item
-                yield [all_values[i] for i in ds]
-            for table in tables:
-                table_id = table["id"]
-                for item in table["content"]["data"]:
-                    all_values = list(table_id.values()) + item
-                    yield [all_values[i] for i in ds]
-
+        # Split kept columns into id columns and data columns, so id values
+        # are projected once per table and data rows are only touched when
+        # some data column is dropped.
+        nid = len(id_names)
+        id_keys = [id_names[i] for i in ds if i < nid]
+        data_ds = [i - nid for i in ds if i >= nid]
+        keep_all_data = data_ds == list(range(len(data_names)))
+        pick = list_getter(data_ds)
+
+        def project(table):
+            assert len(table["id"]) == nid
+            assert table["content"]["column_names"] == data_names
+            table_id = table["id"]
+            prefix = [table_id[k] for k in id_keys]
+            if keep_all_data:
+                return (prefix + item for item in table["content"]["data"])
+            return (prefix + pick(item) for item in table["content"]["data"])
+
+        data = itertools.chain.from_iterable(
+            project(t) for t in itertools.chain([first_table], tables))
         return {
             "column_names": column_names,
             "column_types": column_types,
-            "data": data_generator()
+            "data": data
         }
 
 
+def advise_willneed(fn):
+    '''Ask the kernel to start reading a file in the background'''
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(fn, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def readahead(data_files, depth=16):
+    '''Iterate over data files while prefetching the next `depth` ones'''
+    pending = deque()
+    for data_file in data_files:
+        advise_willneed(data_file["fullpath"])
+        pending.append(data_file)
+        if len(pending) > depth:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+
+def parse_data_file(parser, fn):
+    '''Parse all tables in a data file, runs in worker processes'''
+    return [tbl for tbl in parser.itertables(fn) if tbl]
+
+
 class Collector(object):
     def __init__(self):
         pass
 
-    def collect(self, scanner, parser, aggregator, serializer, archive):
+    def collect(self, scanner, parser, aggregator, serializer, archive,
+                jobs=1):
+        def iterparsed():
+            data_files = readahead(scanner.iterfiles())
+            if jobs <= 1:
+                for data_file in data_files:
+                    yield data_file, parser.itertables(data_file["fullpath"])
+                return
+            # Parse files in worker processes. Only a few files are parsed
+            # ahead, and results are taken in order so ids keep their order.
+            pending = deque()
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                for data_file in data_files:
+                    future = executor.submit(parse_data_file, parser,
+                                             data_file["fullpath"])
+                    pending.append((data_file, future))
+                    if len(pending) >= jobs * 4:
+                        data_file, future = pending.popleft()
+                        yield data_file, future.result()
+                while pending:
+                    data_file, future = pending.popleft()
+                    yield data_file, future.result()
+
         def table_geneartor():
-            for data_file in scanner.iterfiles():
+            for data_file, tables in iterparsed():
                 file_spec = data_file["spec"]
-                for tbl in parser.itertables(data_file["fullpath"]):
+                for tbl in tables:
                     if not tbl:
                         continue
                     spec = OrderedDict(file_spec)
@@ -1265,6 +1556,11 @@ def main():
                        nargs="+",
                        metavar="TABLE_ID",
                        help="Choose which data table to use (as index)")
+    group.add_argument("-j",
+                       "--jobs",
+                       default=1,
+                       type=int,
+                       help="Number of processes to parse files (default: 1)")
     ParserFactory.register_cmd_args(parser)
 
     group = parser.add_argument_group("Aggregator Arguments")
@@ -1330,7 +1626,8 @@ def main():
     serializer = SerializerFactory.create(args.serializer, args)
     # assemble collector and do acutal collecting
     collector = Collector()
-    collector.collect(scanner, parser, aggregator, serializer, args.archive)
+    collector.collect(scanner, parser, aggregator, serializer, args.archive,
+                      args.jobs)
 
 
 if __name__ == "__main__":
@@ -12,32 +12,35 @@ Otherwise, only json to json is supported.
 import argparse
 import collections
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 try:
     import bentoo.yaml
     import json
-    import re
 
     def is_json(content):
-        # Fast check to disginguish json from yml by checking yaml's flow style
-        # list and . It's not complete but works well.
-        if re.findall(r"^\s*- \S+", content):
-            return False
-        elif re.findall(r"\w+\s*:\s*\S+", content):
-            return False
-        else:
-            return True
+        # Config files in json are objects or arrays, so checking the first
+        # non-blank character is enough. Yaml flow style documents may look
+        # the same, they are handled by falling back to yaml when json fails.
+        content = content.lstrip()
+        return bool(content) and content[0] in "{["
 
     def load(fileobj, *args, **kwargs):
         return loads(fileobj.read(), *args, **kwargs)
 
     def loads(string, *args, **kwargs):
         if is_json(string):
-            return json.loads(string,
-                              object_pairs_hook=collections.OrderedDict,
-                              *args,
-                              **kwargs)
-        else:
-            return bentoo.yaml.load(string, bentoo.yaml.RoundTripLoader)
+            try:
+                return json.loads(string,
+                                  object_pairs_hook=collections.OrderedDict,
+                                  *args,
+                                  **kwargs)
+            except ValueError:
+                pass
+        return bentoo.yaml.load(string, bentoo.yaml.RoundTripLoader)
 
     def dump(data, fileobj, *args, **kwargs):
         bentoo.yaml.dump(data, fileobj, Dumper=bentoo.yaml.RoundTripDumper)
@@ -45,31 +48,78 @@ try:
     def dumps(data, *args, **kwargs):
         return bentoo.yaml.dump(data, Dumper=bentoo.yaml.RoundTripDumper)
 
+    def load_all(fileobj):
+        return bentoo.yaml.load_all(fileobj, bentoo.yaml.RoundTripLoader)
+
+    def dump_all(documents, fileobj):
+        bentoo.yaml.dump_all(documents,
+                             fileobj,
+                             Dumper=bentoo.yaml.RoundTripDumper)
+
+    def dump_items(items, fileobj):
+        # Ordered mappings dump to a "!!omap" tag followed by one "- key:
+        # value" entry per item, so dumping each item as a single entry
+        # omap and writing the tag only once gives the same output as dump.
+        tag = "!!omap\n"
+        empty = True
+        for key, value in items:
+            text = dumps(collections.OrderedDict([(key, value)]))
+            fileobj.write(text if empty else text[len(tag):])
+            empty = False
+        if empty:
+            dump(collections.OrderedDict(), fileobj)
+
 except ImportError:
     try:
         import yaml
 
+        # Use libyaml based loader and dumper when pyyaml is built with it
+        Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        Dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
         def dict_representer(dumper, data):
             return dumper.represent_dict(iter(data.items()))
 
         def dict_constructor(loader, node):
             return collections.OrderedDict(loader.construct_pairs(node))
 
-        yaml.add_representer(collections.OrderedDict, dict_representer)
+        yaml.add_representer(collections.OrderedDict,
+                             dict_representer,
+                             Dumper=Dumper)
         yaml.add_constructor(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
-                             dict_constructor)
+                             dict_constructor,
+                             Loader=Loader)
 
         def load(fileobj, *args, **kwargs):
-            return yaml.safe_load(fileobj, *args, **kwargs)
+            return yaml.load(fileobj, Loader=Loader, *args, **kwargs)
 
         def loads(string, *args, **kwargs):
-            return yaml.safe_load(string, *args, **kwargs)
+            return yaml.load(string, Loader=Loader, *args, **kwargs)
 
         def dump(data, fileobj, *args, **kwargs):
-            yaml.safe_dump(data, fileobj, *args, **kwargs)
+            kwargs.setdefault("default_flow_style", False)
+            yaml.dump(data, fileobj, Dumper=Dumper, *args, **kwargs)
 
         def dumps(data, *args, **kwargs):
-            return yaml.safe_dump(data, *args, **kwargs)
+            kwargs.setdefault("default_flow_style", False)
+            return yaml.dump(data, Dumper=Dumper, *args, **kwargs)
+
+        def load_all(fileobj):
+            return yaml.load_all(fileobj, Loader=Loader)
+
+        def dump_all(documents, fileobj):
+            yaml.dump_all(documents,
+                          fileobj,
+                          Dumper=Dumper,
+                          default_flow_style=False)
+
+        def dump_items(items, fileobj):
+            empty = True
+            for key, value in items:
+                dump(collections.OrderedDict([(key, value)]), fileobj)
+                empty = False
+            if empty:
+                dump(collections.OrderedDict(), fileobj)
 
     except ImportError:
         import json
@@ -94,6 +144,59 @@ except ImportError:
             kwargs["indent"] = 2
             return json.dumps(data, *args, **kwargs)
 
+        def load_all(fileobj):
+            yield load(fileobj)
+
+        def dump_all(documents, fileobj):
+            for data in documents:
+                dump(data, fileobj)
+
+        def dump_items(items, fileobj):
+            fileobj.write("{")
+            sep = "\n  "
+            for key, value in items:
+                fileobj.write(sep)
+                fileobj.write(json.dumps(key))
+                fileobj.write(": ")
+                value = json.dumps(value, indent=2)
+                fileobj.write(value.replace("\n", "\n  "))
+                sep = ",\n  "
+            if sep != "\n  ":
+                fileobj.write("\n")
+            fileobj.write("}")
+
+
+def is_json_object(fileobj):
+    '''Check if a seekable file holds a json object by its first character'''
+    pos = fileobj.tell()
+    try:
+        while True:
+            char = fileobj.read(1)
+            if not char or not char.isspace():
+                return char == b"{"
+    finally:
+        fileobj.seek(pos)
+
+
+def convert_stream(src_file, dst_file):
+    '''Convert config files without holding the whole input in memory
+
+    Top level entries of json objects are parsed by ijson and written out one
+    at a time when ijson is installed, yaml documents are converted as soon as
+    each one is loaded.
+    '''
+    with open(src_file, "rb") as src:
+        if ijson is not None and is_json_object(src):
+            items = ijson.kvitems(src,
+                                  "",
+                                  use_float=True,
+                                  map_type=collections.OrderedDict)
+            with open(dst_file, "w") as dst:
+                dump_items(items, dst)
+            return
+    with open(src_file) as src, open(dst_file, "w") as dst:
+        dump_all(load_all(src), dst)
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -101,9 +204,16 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument("src_file", help="Source file to convert")
     parser.add_argument("dst_file", help="Dest file to write to")
+    parser.add_argument("--stream",
+                        action="store_true",
+                        help="Convert incrementally to reduce memory usage")
 
     args = parser.parse_args()
-    dump(load(file(args.src_file)), file(args.dst_file, "w"))
+    if args.stream:
+        convert_stream(args.src_file, args.dst_file)
+    else:
+        with open(args.src_file) as src, open(args.dst_file, "w") as dst:
+            dump(load(src), dst)
 
 
 if __name__ == "__main__":
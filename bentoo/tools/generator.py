@@ -3,15 +3,23 @@
 from __future__ import division, print_function, unicode_literals
 
 import argparse
-import importlib
+import importlib.util
 import itertools
 import json
 import os
 import re
 import shutil
+import stat
 import string
 import sys
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from bentoo.common.conf import load_conf
 from bentoo.common.utils import replace_template, safe_eval
@@ -56,10 +64,13 @@ class SimpleVectorGenerator(object):
 
         '''
         # expand each vector to support `[0, [1, 2], [3, 4]]`
-        for item in self.raw_vectors:
+        def expand(item):
             iters = [x if isinstance(x, list) else [x] for x in item]
-            for v in itertools.product(*iters):
-                yield OrderedDict(zip(self.test_factors, v))
+            return itertools.product(*iters)
+
+        values = itertools.chain.from_iterable(map(expand, self.raw_vectors))
+        return map(OrderedDict,
+                   map(zip, itertools.repeat(self.test_factors), values))
 
     def case_info(self, case):
         '''Return extra information associated with the case
@@ -88,6 +99,9 @@ class CartProductVectorGenerator(object):
     def __init__(self, test_factors, factor_values):
         self.test_factors = test_factors
         self.factor_values = factor_values
+        # value ranges ordered as test factors, ready for itertools.product
+        self.ordered_values = tuple(
+            tuple(factor_values[k]) for k in test_factors)
 
     def items(self):
         '''An iterator over the range of test vectors
@@ -99,9 +113,10 @@ class CartProductVectorGenerator(object):
             OrderedDict.keys() is the test factor names.
 
         '''
-        factor_values = [self.factor_values[k] for k in self.test_factors]
-        for v in itertools.product(*factor_values):
-            yield OrderedDict(zip(self.test_factors, v))
+        # Build test vectors from the product tuples entirely in C
+        values = itertools.product(*self.ordered_values)
+        return map(OrderedDict,
+                   map(zip, itertools.repeat(self.test_factors), values))
 
     def case_info(self, case):
         '''Return extra information associated with the case
@@ -327,6 +342,24 @@ class BenchVectorGenerator(object):
         return info
 
 
+@lru_cache(maxsize=None)
+def load_module(path):
+    '''Load a python module from its absolute path, once per path
+
+    Modules are loaded from the file, so same named modules of different
+    projects do not clash. Its directory is added to `sys.path` once, for the
+    module to import its siblings.
+    '''
+    module_dir = os.path.dirname(path)
+    if module_dir not in sys.path:
+        sys.path.insert(0, module_dir)
+    module_name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
 class CustomVectorGenerator(object):
     '''Custom test vector generator
 
@@ -350,11 +383,7 @@ class CustomVectorGenerator(object):
             raise RuntimeError("Module '%s' does not exists" % module)
         info_func = spec.get("info_func", None)
 
-        module_path = os.path.dirname(module)
-        if module_path not in sys.path:
-            sys.path.insert(0, module_path)
-        module_name = os.path.splitext(os.path.basename(module))[0]
-        mod = importlib.import_module(module_name)
+        mod = load_module(module)
         if not hasattr(mod, func):
             raise RuntimeError("Can not find function '%s' in '%s'" %
                                (func, module))
@@ -396,7 +425,27 @@ class CustomVectorGenerator(object):
             return None
 
 
+def compile_template(value):
+    '''Compile a template value to be rendered by `render_template`
+
+    The value is taken as a string like `replace_template` does. Strings
+    without "$" need no substitution and are kept as is.
+    '''
+    value = str(value)
+    return string.Template(value) if "$" in value else value
+
+
+def render_template(template, varvalues):
+    '''Render a template value compiled by `compile_template`'''
+    if isinstance(template, string.Template):
+        return template.safe_substitute(varvalues)
+    return template
+
+
 class TemplateCaseGenerator(object):
+    # make_case uses absolute paths only, cases can be made concurrently
+    thread_safe = True
+
     def __init__(self, template):
         assert ("case_spec" in template)
         self.template = template.copy()
@@ -406,6 +455,61 @@ class TemplateCaseGenerator(object):
             self.template["link_files"] = OrderedDict()
         if "inst_templates" not in self.template:
             self.template["inst_templates"] = OrderedDict()
+        # template files are shared by cases, keep them once loaded. Racing
+        # threads may load a template twice, which is harmless.
+        self.template_files = {}
+
+        # Compile template strings once, they are rendered for every case
+        def compile_pairs(pairs):
+            return [(compile_template(k), compile_template(v))
+                    for k, v in pairs.items()]
+
+        self.copy_files = compile_pairs(self.template["copy_files"])
+        self.link_files = compile_pairs(self.template["link_files"])
+        inst_tpls = self.template["inst_templates"]
+        self.inst_variables = None
+        if inst_tpls:
+            self.inst_variables = [(k, compile_template(v))
+                                   for k, v in inst_tpls["variables"].items()]
+            self.inst_templates = compile_pairs(inst_tpls["templates"])
+        spec_template = self.template["case_spec"]
+        self.cmd_template = [compile_template(x) for x in spec_template["cmd"]]
+        run_template = spec_template["run"]
+        self.run_template = [
+            (k, compile_template(run_template[k]))
+            for k in ["nnodes", "procs_per_node", "tasks_per_proc", "nprocs"]
+        ]
+        self.results_template = [
+            compile_template(x) for x in spec_template.get("results", [])
+        ]
+        self.envs_template = [
+            (k, compile_template(v))
+            for k, v in spec_template.get("envs", {}).items()
+        ]
+        self.exists_template = []
+        self.contains_template = []
+        validator_template = spec_template.get("validator", None)
+        if validator_template:
+            self.exists_template = [
+                compile_template(x)
+                for x in validator_template.get("exists", [])
+            ]
+            self.contains_template = compile_pairs(
+                validator_template.get("contains", {}))
+
+    def load_template_file(self, srcpath):
+        '''Load a template file as string.Template, reading it only once'''
+        template = self.template_files.get(srcpath)
+        if template is None:
+            mode = stat_mode(srcpath)
+            if mode is None:
+                raise ValueError("Template '%s' does not exist" % srcpath)
+            if not stat.S_ISREG(mode):
+                raise ValueError("Template '%s' is not a file" % srcpath)
+            with open(srcpath) as f:
+                template = string.Template(f.read())
+            self.template_files[srcpath] = template
+        return template
 
     def make_case(self,
                   conf_root,
@@ -423,78 +527,62 @@ class TemplateCaseGenerator(object):
             template_vars.update(case_info)
         # copy case files: each file is defiend as (src, dst), where src is
         # relative to conf_root and dst is relative to case_path.
-        for src, dst in self.template["copy_files"].items():
-            srcpath = replace_template(src, template_vars)
-            dstpath = replace_template(dst, template_vars)
+        for src, dst in self.copy_files:
+            srcpath = render_template(src, template_vars)
+            dstpath = render_template(dst, template_vars)
             if not os.path.isabs(srcpath):
                 srcpath = os.path.join(conf_root, srcpath)
             if not os.path.isabs(dstpath):
                 dstpath = os.path.join(case_path, dstpath)
-            if os.path.exists(dstpath):
-                if os.path.isdir(dstpath):
-                    shutil.rmtree(dstpath)
-                else:
-                    os.remove(dstpath)
-            if not os.path.exists(srcpath):
+            force_remove(dstpath)
+            mode = stat_mode(srcpath)
+            if mode is None:
                 raise ValueError("Case file '%s' not found" % srcpath)
-            if os.path.isdir(srcpath):
+            if stat.S_ISDIR(mode):
                 shutil.copytree(srcpath, dstpath)
             else:
                 shutil.copyfile(srcpath, dstpath)
 
         # link case files: each file is defiend as (src, dst), where src is
         # relative to output_root and dst is relative to case_path.
-        for src, dst in self.template["link_files"].items():
-            srcpath = replace_template(src, template_vars)
-            dstpath = replace_template(dst, template_vars)
+        for src, dst in self.link_files:
+            srcpath = render_template(src, template_vars)
+            dstpath = render_template(dst, template_vars)
             if not os.path.isabs(srcpath):
                 srcpath = os.path.join(output_root, srcpath)
             if not os.path.isabs(dstpath):
                 dstpath = os.path.join(case_path, dstpath)
-            if os.path.exists(dstpath):
-                if os.path.isdir(dstpath):
-                    shutil.rmtree(dstpath)
-                else:
-                    os.remove(dstpath)
+            force_remove(dstpath)
             if not os.path.exists(srcpath):
                 raise ValueError("Case file '%s' not found" % srcpath)
             srcpath = os.path.relpath(srcpath, case_path)
-            if not os.path.exists(os.path.dirname(dstpath)):
-                os.makedirs(os.path.dirname(dstpath))
-            if os.path.exists(dstpath):
-                os.remove(dstpath)
+            make_dirs(os.path.dirname(dstpath))
             os.symlink(srcpath, dstpath)
 
         # instantiate template files based on template substitution
-        inst_tpls = self.template["inst_templates"]
-        if inst_tpls:
+        if self.inst_variables is not None:
             var_values = {}
-            for k, v in inst_tpls["variables"].items():
-                v = replace_template(v, template_vars)
+            for k, v in self.inst_variables:
+                v = render_template(v, template_vars)
                 v = safe_eval(v)
                 var_values[k] = v
-            for src, dst in inst_tpls["templates"].items():
-                srcpath = replace_template(src, template_vars)
-                dstpath = replace_template(dst, template_vars)
+            for src, dst in self.inst_templates:
+                srcpath = render_template(src, template_vars)
+                dstpath = render_template(dst, template_vars)
                 if not os.path.isabs(srcpath):
                     srcpath = os.path.join(conf_root, srcpath)
                 if not os.path.isabs(dstpath):
                     dstpath = os.path.join(case_path, dstpath)
-                if not os.path.exists(srcpath):
-                    raise ValueError("Template '%s' does not exist" % srcpath)
-                if not os.path.isfile(srcpath):
-                    raise ValueError("Template '%s' is not a file" % srcpath)
-                if os.path.exists(dstpath):
-                    os.remove(dstpath)
-                if not os.path.exists(os.path.dirname(dstpath)):
-                    os.makedirs(os.path.dirname(dstpath))
-                content = replace_template(open(srcpath).read(), var_values)
-                open(dstpath, "w").write(content)
+                template = self.load_template_file(srcpath)
+                force_remove(dstpath)
+                make_dirs(os.path.dirname(dstpath))
+                content = template.safe_substitute(var_values)
+                with open(dstpath, "w") as f:
+                    f.write(content)
 
         # generate case spec
         spec_template = self.template["case_spec"]
-        cmd_template = spec_template["cmd"]
-        cmd = [replace_template(x, template_vars) for x in cmd_template]
+        cmd = [render_template(x, template_vars) for x in self.cmd_template]
 
         def transform_path(x):
             x = replace_template(x, {"output_root": output_root})
@@ -512,38 +600,40 @@ class TemplateCaseGenerator(object):
                 raise ValueError("Command binary '%s' does not exists" %
                                  cmd[0])
 
-        run_template = spec_template["run"]
-        run = OrderedDict()
-        for k in ["nnodes", "procs_per_node", "tasks_per_proc", "nprocs"]:
-            v = replace_template(run_template[k], template_vars)
+        # Plain dicts keep key orders and are lighter than OrderedDict
+        run = {}
+        for k, v in self.run_template:
+            v = render_template(v, template_vars)
             v = safe_eval(v)
             run[k] = v
-        rlt_template = spec_template.get("results", [])
-        results = [replace_template(x, template_vars) for x in rlt_template]
-        envs_template = spec_template.get("envs", {})
-        envs = OrderedDict()
-        for k, v in envs_template.items():
-            v = replace_template(v, template_vars)
+        results = [
+            render_template(x, template_vars) for x in self.results_template
+        ]
+        envs = {}
+        for k, v in self.envs_template:
+            v = render_template(v, template_vars)
             v = safe_eval(v)
             envs[k] = v
-        validator = OrderedDict()
-        validator_template = spec_template.get("validator", None)
-        if validator_template:
-            exists_tpl = validator_template.get("exists", [])
-            if exists_tpl:
-                v = [replace_template(x, template_vars) for x in exists_tpl]
-                validator["exists"] = v
-            contains_tpl = validator_template.get("contains", {})
-            if contains_tpl:
-                contains = OrderedDict()
-                for k, v in contains_tpl.items():
-                    k = replace_template(k, template_vars)
-                    v = replace_template(v, template_vars)
-                    contains[k] = v
-                validator["contains"] = contains
-        case_spec = OrderedDict(
-            zip(["cmd", "envs", "run", "results", "validator"],
-                [cmd, envs, run, results, validator]))
+        validator = {}
+        if self.exists_template:
+            validator["exists"] = [
+                render_template(x, template_vars)
+                for x in self.exists_template
+            ]
+        if self.contains_template:
+            contains = {}
+            for k, v in self.contains_template:
+                k = render_template(k, template_vars)
+                v = render_template(v, template_vars)
+                contains[k] = v
+            validator["contains"] = contains
+        case_spec = {
+            "cmd": cmd,
+            "envs": envs,
+            "run": run,
+            "results": results,
+            "validator": validator
+        }
         mirror_files = spec_template.get("mirror_files", None)
         if mirror_files:
             case_spec["mirror_files"] = mirror_files
@@ -551,21 +641,20 @@ class TemplateCaseGenerator(object):
         # create empty output file, so when output file is used for special
         # signal, it's ready and will not be ignored.
         for f in case_spec["results"]:
-            filepath = os.path.join(case_path, f)
-            if not os.path.exists(filepath):
-                open(filepath, "w").write("")
+            touch(os.path.join(case_path, f))
 
         return case_spec
 
 
 class CustomCaseGenerator(object):
+    # user functions run in the case directory, one case at a time
+    thread_safe = False
+
     def __init__(self, module, func, args):
         if not os.path.exists(module):
             raise RuntimeError("Module '%s' does not exists" % module)
 
-        sys.path.insert(0, os.path.abspath(os.path.dirname(module)))
-        module_name = os.path.splitext(os.path.basename(module))[0]
-        mod = importlib.import_module(module_name)
+        mod = load_module(os.path.abspath(module))
         if not hasattr(mod, func):
             raise RuntimeError("Can not find function '%s' in '%s'" %
                                (func, module))
@@ -573,6 +662,13 @@ class CustomCaseGenerator(object):
 
         self.func = fun
         self.args = args
+        # Arguments set per case always override the user provided ones, so
+        # strip them once here and pass the rest as is for every case.
+        base_args = dict(args)
+        for key in ("conf_root", "output_root", "case_path", "test_vector"):
+            base_args.pop(key, None)
+        self.default_case_info = base_args.pop("case_info", None)
+        self.base_args = base_args
 
     def make_case(self,
                   conf_root,
@@ -604,29 +700,47 @@ class CustomCaseGenerator(object):
                 }
 
         '''
-        args = dict(self.args)
-        args["conf_root"] = conf_root
-        args["output_root"] = output_root
-        args["case_path"] = case_path
-        args["test_vector"] = test_vector
-        if case_info:
-            args["case_info"] = case_info
-        case_spec = self.func(**args)
+        case_info = case_info or self.default_case_info
+        # User functions may assume they run in the case directory
+        cwd = os.path.abspath(os.getcwd())
+        os.chdir(case_path)
+        try:
+            if case_info:
+                case_spec = self.func(conf_root=conf_root,
+                                      output_root=output_root,
+                                      case_path=case_path,
+                                      test_vector=test_vector,
+                                      case_info=case_info,
+                                      **self.base_args)
+            else:
+                case_spec = self.func(conf_root=conf_root,
+                                      output_root=output_root,
+                                      case_path=case_path,
+                                      test_vector=test_vector,
+                                      **self.base_args)
+        finally:
+            os.chdir(cwd)
 
         # create empty output file, so when output file is used for special
         # signal, it's ready and will not be ignored.
         for f in case_spec["results"]:
-            filepath = os.path.join(case_path, f)
-            if not os.path.exists(filepath):
-                open(filepath, "w").write("")
+            touch(os.path.join(case_path, f))
 
         return case_spec
 
 
+@lru_cache(maxsize=4096)
+def str_identifier(value):
+    '''Create a valid identifier out of a string'''
+    a = re.sub(r"\W", "_", value.strip().lower())
+    return re.sub(r"_+", "_", a)
+
+
 def identifier(value):
     '''Create a valid identifier out of a value'''
-    a = re.sub(r"\W", "_", str(value).strip().lower())
-    return re.sub(r"_+", "_", a)
+    # Factor names and values repeat across test vectors, cache on the string
+    # form since values may be unhashable.
+    return str_identifier(str(value))
 
 
 class OutputOrganizer(object):
@@ -637,11 +751,9 @@ class OutputOrganizer(object):
         self.version = version
 
     def get_case_path(self, test_vector):
-        segs = [
-            "{0}-{1}".format(identifier(k), identifier(v))
-            for k, v in test_vector.items()
-        ]
-        return os.path.join(*segs)
+        # identifiers are plain words, so joining by os.sep is safe
+        return os.sep.join("{0}-{1}".format(identifier(k), identifier(v))
+                           for k, v in test_vector.items())
 
     def get_project_info_path(self):
         return "TestProject.json"
@@ -650,6 +762,140 @@ class OutputOrganizer(object):
         return os.path.join(self.get_case_path(test_vector), "TestCase.json")
 
 
+def stat_mode(path):
+    '''Return the file mode of a path, or None if it does not exist'''
+    try:
+        return os.stat(path).st_mode
+    except OSError:
+        return None
+
+
+def make_dirs(path):
+    '''Create a directory and its missing parents, if it does not exist
+
+    Case directories mostly have their parents already, so a plain mkdir is
+    tried first and the parents are only walked when it fails.
+    '''
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        if not os.path.isdir(path):
+            raise
+    except FileNotFoundError:
+        os.makedirs(path, exist_ok=True)
+
+
+def force_remove(path):
+    '''Remove a file, symlink or directory tree, if there is one'''
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+        shutil.rmtree(path)
+
+
+def touch(path):
+    '''Create an empty file if it does not exist, keeping existing content'''
+    # O_EXCL fails right away on existing paths, saving the close
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOCTTY
+    try:
+        os.close(os.open(path, flags, 0o666))
+    except FileExistsError:
+        pass
+
+
+def copy_file(srcpath, dstpath):
+    '''Copy file content, in kernel with copy_file_range where possible'''
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(srcpath, "rb") as fsrc, open(dstpath, "wb") as fdst:
+                size = max(os.fstat(fsrc.fileno()).st_size, 1 << 20)
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), size):
+                    pass
+            return
+        except OSError:
+            # not supported by the file systems, fall back to plain copy
+            pass
+    shutil.copyfile(srcpath, dstpath)
+
+
+def copy_file_and_stat(srcpath, dstpath):
+    '''Copy file content and metadata'''
+    copy_file(srcpath, dstpath)
+    shutil.copystat(srcpath, dstpath)
+
+
+def link_file(srcpath, dstpath):
+    '''Hard link a file, falling back to copy across file systems'''
+    try:
+        os.link(srcpath, dstpath)
+    except OSError:
+        copy_file(srcpath, dstpath)
+
+
+def prepare_case_dir(case_fullpath, common_files, link_files=False):
+    '''Create a case directory and copy common case files into it
+
+    Args:
+        case_fullpath (str): Absolute path for the test case.
+        common_files (list): `(srcpath, filename)` of the common case files.
+        link_files (bool): Hard link common case files instead of copy.
+    '''
+    make_dirs(case_fullpath)
+    place_file = link_file if link_files else copy_file
+    for srcpath, filename in common_files:
+        dstpath = os.path.join(case_fullpath, filename)
+        force_remove(dstpath)
+        place_file(srcpath, dstpath)
+
+
+def dumps_json(obj):
+    '''Serialize a python object to indented json, using orjson if possible'''
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2).encode("utf-8")
+
+
+def write_json(obj, fn):
+    '''Write a python object to a json file'''
+    with open(fn, "wb") as f:
+        f.write(dumps_json(obj))
+
+
+def write_json_streamed(obj, key, items, fn):
+    '''Write a json object with its last entry being a streamed array
+
+    The output is the same as `write_json` with `obj[key] = list(items)`, but
+    each item is serialized and written as soon as it is generated.
+
+    Args:
+        obj (dict): The json object without `key`.
+        key (str): Name of the array entry.
+        items (iterable): Elements of the array.
+        fn (str): Name of the file to write.
+    '''
+    with open(fn, "wb") as f:
+        # Reopen the serialized object to append the array to it, an empty
+        # object is serialized as "{}" in one line.
+        head = dumps_json(obj)
+        if head.endswith(b"\n}"):
+            f.write(head[:-2] + b",")
+        else:
+            assert head == b"{}"
+            f.write(b"{")
+        f.write(b"\n  " + dumps_json(key) + b": [")
+        sep = b"\n    "
+        for item in items:
+            f.write(sep)
+            f.write(dumps_json(item).replace(b"\n", b"\n    "))
+            sep = b",\n    "
+        f.write(b"]\n}" if sep == b"\n    " else b"\n  ]\n}")
+
+
 class TestProjectBuilder(object):
     def __init__(self, conf_root):
         if not os.path.isabs(conf_root):
@@ -730,8 +976,7 @@ class TestProjectBuilder(object):
         # Prepare directories
         if not os.path.isabs(output_root):
             output_root = os.path.abspath(output_root)
-        if not os.path.exists(output_root):
-            os.makedirs(output_root)
+        os.makedirs(output_root, exist_ok=True)
 
         # Handle data files: leave absolute path as-is, copy or link relative
         # path to the output directory
@@ -740,101 +985,149 @@ class TestProjectBuilder(object):
                 continue
             srcpath = os.path.join(self.conf_root, path)
             dstpath = os.path.join(output_root, path)
-            if not os.path.exists(srcpath):
+            # stat once and classify the source by its mode
+            mode = stat_mode(srcpath)
+            if mode is None:
                 raise RuntimeError("Data file specified but not found: '%s'" %
                                    path)
-            if os.path.isdir(srcpath):
-                dstdir = os.path.dirname(dstpath)
-                if not os.path.exists(dstdir):
-                    os.makedirs(dstdir)
-                if os.path.exists(dstpath):
-                    if os.path.islink(dstpath):
-                        os.remove(dstpath)
-                    elif os.path.isdir(dstpath):
-                        shutil.rmtree(dstpath)
-                    else:
-                        os.remove(dstpath)
+            if stat.S_ISDIR(mode):
+                make_dirs(os.path.dirname(dstpath))
+                force_remove(dstpath)
                 if link_files:
                     os.symlink(srcpath, dstpath)
                 else:
-                    shutil.copytree(srcpath, dstpath)
-            elif os.path.isfile(srcpath):
-                dstdir = os.path.dirname(dstpath)
-                if not os.path.exists(dstdir):
-                    os.makedirs(dstdir)
-                if os.path.exists(dstpath):
-                    if os.path.islink(dstpath):
-                        os.remove(dstpath)
-                    elif os.path.isdir(dstpath):
-                        shutil.rmtree(dstpath)
-                    else:
-                        os.remove(dstpath)
+                    shutil.copytree(srcpath,
+                                    dstpath,
+                                    copy_function=copy_file_and_stat)
+            elif stat.S_ISREG(mode):
+                make_dirs(os.path.dirname(dstpath))
+                force_remove(dstpath)
                 if link_files:
                     os.symlink(srcpath, dstpath)
                 else:
-                    shutil.copyfile(srcpath, dstpath)
-                    shutil.copystat(srcpath, dstpath)
+                    copy_file_and_stat(srcpath, dstpath)
             else:
                 raise RuntimeError("File type not supported: '%s'" % path)
 
-        # Generate test cases and write test case config
-        for case in self.test_vector_generator.items():
+        # copy common case files to case path, only ordinary file is, each
+        # file is copied to the case path, without reconstructing the dir.
+        common_files = []
+        for path in self.common_case_files:
+            srcpath = path
+            if not os.path.isabs(path):
+                srcpath = os.path.join(self.conf_root, path)
+            mode = stat_mode(srcpath)
+            if mode is None:
+                raise ValueError("Common case file '%s' not found" % path)
+            if not stat.S_ISREG(mode):
+                raise ValueError("Common case file '%s' is not a file." % path)
+            common_files.append((srcpath, os.path.basename(path)))
+
+        def describe(case):
             case_path = self.output_organizer.get_case_path(case)
             case_fullpath = os.path.join(output_root, case_path)
             case_info = self.test_vector_generator.case_info(case)
-            if not os.path.exists(case_fullpath):
-                os.makedirs(case_fullpath)
-
-            # copy common case files to case path, only ordinary file is, each
-            # file is copied to the case path, without reconstructing the dir.
-            for path in self.common_case_files:
-                srcpath = path
-                if not os.path.isabs(path):
-                    srcpath = os.path.join(self.conf_root, path)
-                if not os.path.isfile(srcpath):
-                    raise ValueError("Common case file '%s' is not a file." %
-                                     path)
-                if not os.path.exists(srcpath):
-                    raise ValueError("Common case file '%s' not found" % path)
-                dstpath = os.path.join(case_fullpath, os.path.basename(path))
-                if os.path.exists(dstpath):
-                    os.remove(dstpath)
-                shutil.copyfile(srcpath, dstpath)
+            return (case, case_path, case_fullpath, case_info)
+
+        # Cases are made in a thread pool when the case generator allows it
+        # and no two cases share a directory, which needs all test vectors
+        # up front. Otherwise test vectors are streamed and cases are made
+        # one by one, custom case generators change to the case directory to
+        # run user functions. Case specs are always written by the pool.
+        parallel = getattr(self.test_case_generator, "thread_safe", False)
+        if parallel:
+            cases = [describe(x) for x in self.test_vector_generator.items()]
+            case_dirs = list(OrderedDict.fromkeys(x[2] for x in cases))
+            parallel = len(case_dirs) == len(cases)
+        else:
+            cases = map(describe, self.test_vector_generator.items())
 
-            cwd = os.path.abspath(os.getcwd())
-            os.chdir(case_fullpath)
-            try:
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            def make_case(case, case_fullpath, case_info):
                 case_spec = self.test_case_generator.make_case(
                     self.conf_root, output_root, case_fullpath, case,
                     case_info)
                 if case_info:
                     case_spec["case_info"] = case_info
-            finally:
-                os.chdir(cwd)
-
-            case_spec_path = self.output_organizer.get_case_spec_path(case)
-            case_spec_fullpath = os.path.join(output_root, case_spec_path)
-            json.dump(case_spec, open(case_spec_fullpath, "w"), indent=2)
-
-        # Write project config
-        info = [("version", 1), ("name", self.name),
-                ("test_factors", self.test_factors)]
-        info = OrderedDict(info)
-        info["data_files"] = self.data_files
-        test_defs = []
-        for case in self.test_vector_generator.items():
-            vector = list(case.values())
-            path = self.output_organizer.get_case_path(case)
-            test_def = OrderedDict(zip(["test_vector", "path"],
-                                       [vector, path]))
-            case_info = self.test_vector_generator.case_info(case)
-            if case_info:
-                test_def["case_info"] = case_info
-            test_defs.append(test_def)
-        info["test_cases"] = test_defs
-        project_info_path = self.output_organizer.get_project_info_path()
-        project_info_fullpath = os.path.join(output_root, project_info_path)
-        json.dump(info, open(project_info_fullpath, "w"), indent=2)
+                return case_spec
+
+            def write_case_spec(case_fullpath, case_spec):
+                case_spec_fullpath = os.path.join(case_fullpath,
+                                                  "TestCase.json")
+                write_json(case_spec, case_spec_fullpath)
+
+            def make_and_write_case(case, case_fullpath, case_info):
+                case_spec = make_case(case, case_fullpath, case_info)
+                write_case_spec(case_fullpath, case_spec)
+
+            spec_writes = []
+            if parallel:
+                list(
+                    executor.map(prepare_case_dir, case_dirs,
+                                 itertools.repeat(common_files),
+                                 itertools.repeat(link_files)))
+                for case, _, case_fullpath, case_info in cases:
+                    spec_writes.append(
+                        executor.submit(make_and_write_case, case,
+                                        case_fullpath, case_info))
+                # All cases must be made before the project config is
+                # written, queued cases are dropped at the first failure.
+                try:
+                    for future in as_completed(spec_writes):
+                        future.result()
+                except BaseException:
+                    for future in spec_writes:
+                        future.cancel()
+                    raise
+
+            # Generate test cases and write test case config, test case
+            # definitions are streamed to the project config along the way.
+            def iter_test_defs():
+                prepared = set()
+                for case, case_path, case_fullpath, case_info in cases:
+                    if not parallel:
+                        if case_fullpath not in prepared:
+                            prepare_case_dir(case_fullpath, common_files,
+                                             link_files)
+                            prepared.add(case_fullpath)
+                        case_spec = make_case(case, case_fullpath, case_info)
+                        spec_writes.append(
+                            executor.submit(write_case_spec, case_fullpath,
+                                            case_spec))
+
+                    test_def = {
+                        "test_vector": list(case.values()),
+                        "path": case_path
+                    }
+                    if case_info:
+                        test_def["case_info"] = case_info
+                    yield test_def
+
+            # Write project config
+            info = {
+                "version": 1,
+                "name": self.name,
+                "test_factors": self.test_factors,
+                "data_files": self.data_files
+            }
+            project_info_path = self.output_organizer.get_project_info_path()
+            project_info_fullpath = os.path.join(output_root,
+                                                 project_info_path)
+            # The project config is streamed to a temporary file and put in
+            # place only when every case is made and written, so a failed
+            # run leaves no project config pointing at missing cases.
+            tmp_fullpath = project_info_fullpath + ".tmp"
+            try:
+                write_json_streamed(info, "test_cases", iter_test_defs(),
+                                    tmp_fullpath)
+                for future in spec_writes:
+                    future.result()
+            except BaseException:
+                force_remove(tmp_fullpath)
+                raise
+            os.replace(tmp_fullpath, project_info_fullpath)
 
 
 def main():
@@ -843,7 +1136,8 @@ def main():
     parser.add_argument("output_root", help="Output directory")
     parser.add_argument("--link-files",
                         action="store_true",
-                        help="Sympolic link data files instead of copy")
+                        help="Sympolic link data files and hard link "
+                        "common case files instead of copy")
 
     config = parser.parse_args()
     project = TestProjectBuilder(config.conf_root)
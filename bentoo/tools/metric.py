@@ -28,11 +28,21 @@ User defined metrics example:
 from builtins import zip
 from builtins import str
 from builtins import map
+import ast
+import collections
+import itertools
+import math
 import os
 import re
 import argparse
+import shutil
 import sqlite3
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 try:
     import yaml
 
@@ -57,14 +67,22 @@ except ImportError:
             string, object_pairs_hook=collections.OrderedDict, *args, **kwargs)
 
 
+# Number of rows whose metrics are evaluated together as arrays
+CHUNK_SIZE = 10000
+
+# Regex patterns, compiled once at import
+TOKEN_PTN = re.compile(r"[^a-zA-Z0-9_]")
+METRIC_UNIT_PTN = re.compile(r"\[.+\]")
+
+# Python operators with the same meaning in sqlite expressions
+SQL_OPERATORS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/"}
+
 SQLITE_TYPE = {
     type(None): "NULL",
     int: "INTEGER",
-    int: "INTEGER",
     float: "REAL",
     str: "TEXT",
-    str: "TEXT",
-    buffer: "BLOB"
+    bytes: "BLOB"
 }
 
 
@@ -74,7 +92,17 @@ def split_columns(columns):
     return (columns[:timer_column_index + 1], columns[timer_column_index + 1:])
 
 
+def compile_formula(formula):
+    '''Compile a metric formula, None if it is not a valid expression'''
+    try:
+        return compile(formula, "<metric>", "eval")
+    except SyntaxError:
+        return None
+
+
 def eval_formula(formula, values):
+    if formula is None:
+        return 0
     try:
         result = eval(formula, values)
     except:
@@ -82,18 +110,92 @@ def eval_formula(formula, values):
     return result
 
 
+def eval_formula_columns(formula, columns, nrows):
+    '''Evaluate a formula over whole columns with numpy
+
+    Rows where `eval_formula` fails, such as division by zero or missing
+    values, give inf or nan here, so non-finite values shall be evaluated
+    again row by row. Returns None if the formula does not evaluate on arrays,
+    e.g., it uses non-numeric columns or python only constructs.
+    '''
+    if formula is None:
+        return [0] * nrows
+    try:
+        with numpy.errstate(all="ignore"):
+            result = eval(formula, dict(columns))
+            result = numpy.asarray(result, dtype=float)
+            result = numpy.broadcast_to(result, (nrows, ))
+    except Exception:
+        return None
+    return result.tolist()
+
+
+def formula_to_sql(formula, columns):
+    '''Translate an arithmetic formula into a sqlite expression
+
+    `columns` maps variable names to the numeric columns they refer to.
+    Returns None if the formula uses anything other than numbers, variables
+    and the +, -, *, / operators.
+    '''
+    def emit(node):
+        if isinstance(node, ast.BinOp) and type(node.op) in SQL_OPERATORS:
+            left = emit(node.left)
+            right = emit(node.right)
+            if isinstance(node.op, ast.Div):
+                # true division as in python, even for integers
+                left = "CAST({0} AS REAL)".format(left)
+            op = SQL_OPERATORS[type(node.op)]
+            return "({0} {1} {2})".format(left, op, right)
+        elif isinstance(node, ast.UnaryOp) and isinstance(
+                node.op, (ast.UAdd, ast.USub)):
+            op = "-" if isinstance(node.op, ast.USub) else "+"
+            return "({0}{1})".format(op, emit(node.operand))
+        elif isinstance(node, ast.Constant) and type(node.value) in (int,
+                                                                    float):
+            if not math.isfinite(node.value):
+                raise ValueError(node.value)
+            return repr(node.value)
+        elif isinstance(node, ast.Name) and node.id in columns:
+            return quote(columns[node.id])
+        raise ValueError(ast.dump(node))
+
+    try:
+        return emit(ast.parse(formula, mode="eval").body)
+    except (SyntaxError, ValueError):
+        return None
+
+
 def quote(x):
     return "\"{}\"".format(x)
 
 
 def tokenize(x):
-    return re.sub(r"[^a-zA-Z0-9_]", "_", x)
+    return TOKEN_PTN.sub("_", x)
+
+
+def read_pragmas(conn):
+    '''Tune a sqlite connection for large scans and sorts in memory'''
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA mmap_size=268435456")
 
 
-def compute_metrics(input_db, output_db, spec):
+def fast_pragmas(conn):
+    '''Tune a sqlite connection for fast writes, trading off durability
+
+    A crash during writing may corrupt the database, which is fine for
+    output databases that are regenerated anyway.
+    '''
+    read_pragmas(conn)
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA journal_mode=MEMORY")
+
+
+def compute_metrics(input_db, output_db, spec, unsafe_fast=True):
     # Open input database
     conn0 = sqlite3.connect(input_db)
     conn0.row_factory = sqlite3.Row
+    read_pragmas(conn0)
 
     # Discover the structure of input database and define output database
     # structure.
@@ -108,6 +210,8 @@ def compute_metrics(input_db, output_db, spec):
 
     # Create output database
     conn1 = sqlite3.connect(output_db)
+    if unsafe_fast:
+        fast_pragmas(conn1)
     conn1.execute("DROP TABLE IF EXISTS result")
     type_pairs = list(zip(output_columns, output_types))
     sql = ["\"{0}\" {1}".format(k, SQLITE_TYPE[v]) for k, v in type_pairs]
@@ -115,29 +219,115 @@ def compute_metrics(input_db, output_db, spec):
     conn1.execute(sql)
     conn1.commit()
 
-    def compute_one_row(row):
-        var_values = dict(row)
-        for item in spec["data"]:
-            if isinstance(item, list):
-                k, v = list(map(str, item))
-                var_values[v] = row[k]
-        result = [row[k] for k in index_columns]
-        for item in spec["metrics"]:
-            value = eval_formula(item["formula"], var_values)
-            result.append(value)
-        return result
+    # Formulas are compiled once and evaluated for every row
+    formulas = [compile_formula(x["formula"]) for x in spec["metrics"]]
+
+    renames = [list(map(str, x)) for x in spec["data"] if isinstance(x, list)]
 
     select = list(map(quote, input_columns))
     select = ", ".join(select)
     order_by = list(map(quote, index_columns))
     order_by = ", ".join(order_by)
+
+    # Metrics made of plain arithmetic over numeric columns are computed by
+    # sqlite within the query, rows are then never fetched into python.
+    # Errors such as division by zero give NULL, which becomes 0 as in
+    # `eval_formula`.
+    sql_columns = {}
+    for k in input_columns:
+        if type(r0[k]) in (int, float):
+            sql_columns[k] = k
+    for k, v in renames:
+        if k in sql_columns:
+            sql_columns[v] = k
+        else:
+            sql_columns.pop(v, None)
+    metric_sql = []
+    for item, formula in zip(spec["metrics"], formulas):
+        if formula is None:
+            metric_sql.append("0")
+        else:
+            metric_sql.append(formula_to_sql(item["formula"], sql_columns))
+    if all(x is not None for x in metric_sql):
+        conn1.close()
+        metric_select = list(map(quote, index_columns))
+        metric_select.extend("IFNULL({0}, 0)".format(x) for x in metric_sql)
+        metric_select = ", ".join(metric_select)
+        select_sql = "SELECT {0} FROM result ORDER BY {1}".format(
+            metric_select, order_by)
+        conn0.execute("ATTACH DATABASE ? AS output", (output_db, ))
+        if unsafe_fast:
+            conn0.execute("PRAGMA output.synchronous=OFF")
+            conn0.execute("PRAGMA output.journal_mode=MEMORY")
+        conn0.execute("INSERT INTO output.result {0}".format(select_sql))
+        conn0.commit()
+        conn0.execute("DETACH DATABASE output")
+        conn0.close()
+        return
+
+    def row_values(row):
+        var_values = dict(row)
+        for k, v in renames:
+            var_values[v] = row[k]
+        return var_values
+
+    def numeric_columns(rows):
+        # Rows are transposed once, then each column becomes a float array
+        arrays = {}
+        for name, values in zip(input_columns, zip(*rows)):
+            try:
+                arrays[name] = numpy.array(values, dtype=float)
+            except (TypeError, ValueError):
+                pass
+        columns = dict(arrays)
+        for k, v in renames:
+            if k in arrays:
+                columns[v] = arrays[k]
+            else:
+                columns.pop(v, None)
+        return columns
+
+    def compute_chunk(rows):
+        # Numeric metrics are evaluated for all rows at once when numpy is
+        # available, other metrics and failed ones are evaluated row by row.
+        result = [[row[k] for k in index_columns] for row in rows]
+        columns = None
+        all_values = None
+        for item, formula in zip(spec["metrics"], formulas):
+            values = None
+            if numpy is not None and item["type"] in (int, float):
+                if columns is None:
+                    columns = numeric_columns(rows)
+                values = eval_formula_columns(formula, columns, len(rows))
+                if values is not None:
+                    # Tell errors, which give 0, from real infinite values
+                    for i, v in enumerate(values):
+                        if not math.isfinite(v):
+                            values[i] = eval_formula(formula,
+                                                     row_values(rows[i]))
+            if values is None:
+                if all_values is None:
+                    all_values = [row_values(row) for row in rows]
+                values = [eval_formula(formula, x) for x in all_values]
+            for r, v in zip(result, values):
+                r.append(v)
+        return result
+
+    def iterchunks(cursor):
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                return
+            yield rows
+
     select_sql = "SELECT {0} FROM result ORDER BY {1}".format(select, order_by)
+    # Stream computed rows from the input cursor into one executemany call,
+    # all rows are inserted in a single transaction.
     data = conn0.execute(select_sql)
-    for row in data.fetchall():
-        row_values = compute_one_row(row)
-        ph_sql = ", ".join(["?"] * len(row_values))
-        insert_row_sql = "INSERT INTO result VALUES ({0})".format(ph_sql)
-        conn1.execute(insert_row_sql, row_values)
+    ph_sql = ", ".join(["?"] * len(output_columns))
+    insert_row_sql = "INSERT INTO result VALUES ({0})".format(ph_sql)
+    rows = itertools.chain.from_iterable(map(compute_chunk, iterchunks(data)))
+    conn1.executemany(insert_row_sql, rows)
     conn1.commit()
 
     conn1.close()
@@ -152,34 +342,45 @@ def locate_likwid_groupfile(arch, group):
     group_file = os.path.join(user_conf_path, arch, group + ".txt")
     if os.path.exists(group_file):
         return group_file
-    sys_path = os.environ["PATH"].split(":")
-    for p in sys_path:
-        if os.path.exists(os.path.join(p, "likwid-perfctr")):
-            likwid_home = os.path.dirname(os.path.abspath(p))
-            group_file = os.path.join(likwid_home, "share", "likwid",
-                                      "perfgroups", arch, group + ".txt")
-            if not os.path.exists(group_file):
-                raise ValueError("Bad likwid installation: can not find "
-                                 "'%s' for '%s' in '%s'" % (group, arch,
-                                                            likwid_home))
-            return group_file
-    raise ValueError("Can not find likwid group '%s' for '%s'" % (group, arch))
+    perfctr = shutil.which("likwid-perfctr")
+    if perfctr is None:
+        raise ValueError("Can not find likwid group '%s' for '%s'" %
+                         (group, arch))
+    likwid_home = os.path.dirname(os.path.dirname(os.path.abspath(perfctr)))
+    group_file = os.path.join(likwid_home, "share", "likwid", "perfgroups",
+                              arch, group + ".txt")
+    if not os.path.exists(group_file):
+        raise ValueError("Bad likwid installation: can not find "
+                         "'%s' for '%s' in '%s'" % (group, arch, likwid_home))
+    return group_file
 
 
 def parse_likwid_metrics(group_file):
-    match = re.search(r"EVENTSET\n(.*?)\n\nMETRICS\n(.*?)\n\n",
-                      file(group_file).read(), re.S)
-    assert match
+    # Sections are collected in one pass over the lines, each one ends at a
+    # blank line or at the end of file.
+    sections = {"EVENTSET": [], "METRICS": []}
+    current = None
+    with open(group_file) as f:
+        for line in f:
+            line = line.strip()
+            if current is None:
+                current = sections.get(line)
+            elif line:
+                current.append(line)
+            else:
+                current = None
+    assert sections["EVENTSET"] and sections["METRICS"]
     data = ["time", "inverseClock"]
-    for eventstr in match.group(1).split("\n"):
+    for eventstr in sections["EVENTSET"]:
         counter, event = eventstr.split()
         data.append(["{}:{}".format(event, counter), counter])
     metrics = []
-    for metricstr in match.group(2).split("\n"):
+    for metricstr in sections["METRICS"]:
         segs = metricstr.split()
         formula = segs[-1]
         name = segs[:-1]
-        if re.match(r"\[.+\]", name[-1]):
+        # units are bracketed, skip the regex for plain name words
+        if name[-1].startswith("[") and METRIC_UNIT_PTN.match(name[-1]):
             name = name[:-1]
         name = " ".join(name)
         f = {"name": name, "type": float, "formula": formula}
@@ -188,7 +389,8 @@ def parse_likwid_metrics(group_file):
 
 
 def parse_user_metrics(metric_file):
-    content = load(file(metric_file))
+    with open(metric_file) as f:
+        content = load(f)
     spec = {"data": content["data"], "metrics": []}
     spec["data"] = content["data"]
     for item in content["metrics"]:
@@ -216,6 +418,11 @@ def main():
         "--user-metrics",
         default=None,
         help="User defined metrics (json or yaml)")
+    parser.add_argument(
+        "--no-unsafe-fast",
+        dest="unsafe_fast",
+        action="store_false",
+        help="Write the output database with sqlite's durable defaults")
 
     args = parser.parse_args()
     if args.likwid_archgroup:
@@ -229,7 +436,7 @@ def main():
     else:
         raise ValueError("No metrics is supplied")
 
-    compute_metrics(args.input_db, args.output_db, metrics)
+    compute_metrics(args.input_db, args.output_db, metrics, args.unsafe_fast)
 
 
 if __name__ == "__main__":
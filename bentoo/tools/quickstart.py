@@ -4,23 +4,25 @@
 
 from __future__ import print_function
 import argparse
+import json
 import os
-import re
 import string
 import textwrap
 
 TEXT_WIDTH = 78
 SEP_LINE = "-" * TEXT_WIDTH
 
+# Wrappers are shared by all messages and prompts
+TEXT_WRAPPER = textwrap.TextWrapper(width=TEXT_WIDTH)
+INPUT_WRAPPER = textwrap.TextWrapper(width=TEXT_WIDTH, drop_whitespace=False)
+
 
 def wrap_print(msg):
-    print(textwrap.fill(msg, width=TEXT_WIDTH))
+    print(TEXT_WRAPPER.fill(msg))
 
 
 def wrap_input(msg):
-    return input(
-        textwrap.fill(
-            msg, width=TEXT_WIDTH, drop_whitespace=False))
+    return input(INPUT_WRAPPER.fill(msg))
 
 
 def get_choice(message, choices, default=0):
@@ -35,7 +37,7 @@ def get_choice(message, choices, default=0):
         if not choice:
             print(SEP_LINE)
             return default
-        if not re.match(r"\d+", choice):
+        if not choice.isdecimal():
             continue
         choice = int(choice)
         if choice < 0 or choice >= len(choices):
@@ -85,41 +87,34 @@ def get_input(message):
 
 
 def make_directories(project_dir):
-    if not os.path.exists(project_dir):
-        os.makedirs(project_dir)
-    bin_dir = os.path.join(project_dir, "bin")
-    if not os.path.exists(bin_dir):
-        os.makedirs(bin_dir)
+    os.makedirs(os.path.join(project_dir, "bin"), exist_ok=True)
 
 
 TEST_PROJECT_CONFIG_JSON_TPL = '''{
     "version": 1,
     "project": {
-        "name": "${project_desc}",
-        "test_factors": [${test_factors}],
-        "test_vector_generator": "${vector_gen}",
-        "test_case_generator": "${case_gen}",
+        "name": %(project_desc)s,
+        "test_factors": [%(test_factors)s],
+        "test_vector_generator": "%(vector_gen)s",
+        "test_case_generator": "%(case_gen)s",
         "data_files": ["bin"]
     },
-    ${vector_generator_config},
-    ${case_generator_config}
+    %(vector_generator_config)s,
+    %(case_generator_config)s
 }
 '''
 
 
 def make_config(project_dir, project_desc, binary_name, test_factors,
                 vector_gen, case_gen):
-    test_factors_repr = ", ".join(["\"%s\"" % x for x in test_factors])
+    # User supplied strings are json encoded, so quotes and backslashes in
+    # them are escaped properly.
+    test_factors_repr = ", ".join(json.dumps(x) for x in test_factors)
     if vector_gen == "cart_product":
-        vector_generator_config = '''"cart_product_vector_generator": {
-        "test_factor_values": {\n'''
-        tmp = []
-        for t in test_factors:
-            tmp.append("            \"%s\": []" % t)
-        vector_generator_config += ",\n".join(tmp)
-        vector_generator_config += '''
-        }
-    }'''
+        values = {x: [] for x in test_factors}
+        values = json.dumps({"test_factor_values": values}, indent=4)
+        vector_generator_config = "\"cart_product_vector_generator\": %s" % (
+            values.replace("\n", "\n    "))
     elif vector_gen == "simple":
         vector_generator_config = '''"simple_vector_generator": {
         "test_vectors": [
@@ -171,16 +166,17 @@ def make_config(project_dir, project_desc, binary_name, test_factors,
     }'''
     else:
         raise NotImplementedError()
-    tpl = string.Template(TEST_PROJECT_CONFIG_JSON_TPL)
-    out = tpl.safe_substitute(
-        project_desc=project_desc,
-        test_factors=test_factors_repr,
-        vector_gen=vector_gen,
-        case_gen=case_gen,
-        vector_generator_config=vector_generator_config,
-        case_generator_config=case_generator_config)
+    out = TEST_PROJECT_CONFIG_JSON_TPL % {
+        "project_desc": json.dumps(project_desc),
+        "test_factors": test_factors_repr,
+        "vector_gen": vector_gen,
+        "case_gen": case_gen,
+        "vector_generator_config": vector_generator_config,
+        "case_generator_config": case_generator_config
+    }
     outfn = os.path.join(project_dir, "TestProjectConfig.json")
-    open(outfn, "w").write(out)
+    with open(outfn, "w") as f:
+        f.write(out)
 
 
 CUSTOM_PYTHON_SCRIPT_TPL_P1 = '''#!/usr/bin/env python
@@ -250,7 +246,8 @@ def make_custom_script(template, project_dir, binary_name, test_factors):
     out = tpl.safe_substitute(
         binary_name=binary_name, test_factors_repr=test_factors_repr)
     outfn = os.path.join(project_dir, "make-case.py")
-    open(outfn, "w").write(out)
+    with open(outfn, "w") as f:
+        f.write(out)
     os.chmod(outfn, 0o755)
 
 
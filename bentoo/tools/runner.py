@@ -10,11 +10,11 @@ and plain mpirun at the moment. More backends will be added overtime.
 from __future__ import division, print_function, unicode_literals
 
 import argparse
+import concurrent.futures
 import fnmatch
 import json
 import os
 import re
-import string
 import subprocess
 import sys
 import time
@@ -52,13 +52,57 @@ from bentoo.common.utils import has_program, make_bash_script, shell_quote
 #
 
 
+def run_with_tee(cmd, env, cwd, out_fn):
+    '''Run a command, copying its stdout and stderr to stdout and out_fn
+
+    Output is copied in process instead of through a `tee` process. Returns
+    the exit code of the command.
+    '''
+    proc = subprocess.Popen(cmd,
+                            env=env,
+                            cwd=cwd,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT,
+                            close_fds=False)
+    sys.stdout.flush()
+    stdout_fd = sys.stdout.fileno()
+    out_fd = os.open(out_fn, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        pipe_fd = proc.stdout.fileno()
+        while True:
+            chunk = os.read(pipe_fd, 65536)
+            if not chunk:
+                break
+            os.write(stdout_fd, chunk)
+            os.write(out_fd, chunk)
+    finally:
+        os.close(out_fd)
+        proc.stdout.close()
+    return proc.wait()
+
+
+def run_to_files(cmd, env, cwd, out_fn, err_fn):
+    '''Run a command with its stdout and stderr written to files
+
+    Python opens files as non-inheritable, so there is nothing to close in
+    the child and the close_fds pass is skipped. Returns the exit code.
+    '''
+    with open(out_fn, "w") as out, open(err_fn, "w") as err:
+        return subprocess.call(cmd,
+                               env=env,
+                               cwd=cwd,
+                               stdout=out,
+                               stderr=err,
+                               close_fds=False)
+
+
 class MpirunLauncher(object):
     '''Job launcher for mpirun (plain mpi)'''
     @classmethod
     def is_available(cls):
-        if has_program(["mpirun", "-h"]):
+        if has_program("mpirun"):
             return True
-        elif has_program(["mpiexec", "-h"]):
+        elif has_program("mpiexec"):
             return True
         return False
 
@@ -81,6 +125,7 @@ class MpirunLauncher(object):
 
     def __init__(self, args):
         self.args = args
+        self.base_env = os.environ.copy()
 
     def run(self,
             case,
@@ -104,9 +149,8 @@ class MpirunLauncher(object):
         if timeout:
             cmd = ["timeout", "{0}m".format(timeout)] + cmd
 
-        env = dict(os.environ)
-        for k, v in spec["envs"].items():
-            env[k] = str(v)
+        env = self.base_env.copy()
+        env.update((k, str(v)) for k, v in spec["envs"].items())
 
         if make_script:
             make_bash_script(None, spec["envs"], [cmd],
@@ -119,22 +163,9 @@ class MpirunLauncher(object):
         err_fn = os.path.join(path, "STDERR")
 
         if verbose:
-            proc1 = subprocess.Popen(cmd,
-                                     env=env,
-                                     cwd=path,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.STDOUT)
-            proc2 = subprocess.Popen(["tee", out_fn],
-                                     cwd=path,
-                                     stdin=proc1.stdout)
-            proc1.stdout.close()
-            ret = proc2.wait()
+            ret = run_with_tee(cmd, env, path, out_fn)
         else:
-            ret = subprocess.call(cmd,
-                                  env=env,
-                                  cwd=path,
-                                  stdout=open(out_fn, "w"),
-                                  stderr=open(err_fn, "w"))
+            ret = run_to_files(cmd, env, path, out_fn, err_fn)
 
         if ret == 0:
             return "success"
@@ -147,7 +178,7 @@ class YhrunLauncher(object):
     '''Job launcher for yhrun (slurm variants on tianhe)'''
     @classmethod
     def is_available(cls):
-        if has_program(["yhrun", "-h"]):
+        if has_program("yhrun"):
             return True
         return False
 
@@ -194,6 +225,7 @@ class YhrunLauncher(object):
 
     def __init__(self, args):
         self.args = args
+        self.base_env = os.environ.copy()
 
     def run(self,
             case,
@@ -299,7 +331,7 @@ class YhrunLauncher(object):
             if dryrun:
                 return None
 
-            subprocess.call(yhbatch_cmd, cwd=path)
+            subprocess.call(yhbatch_cmd, cwd=path, close_fds=False)
             # yhbatch always success
             return "success"
 
@@ -313,24 +345,11 @@ class YhrunLauncher(object):
             out_fn = os.path.join(path, "STDOUT")
             err_fn = os.path.join(path, "STDERR")
 
-            env.update(os.environ)
+            env.update(self.base_env)
             if verbose:
-                proc1 = subprocess.Popen(cmd,
-                                         env=env,
-                                         cwd=path,
-                                         stdout=subprocess.PIPE,
-                                         stderr=subprocess.STDOUT)
-                proc2 = subprocess.Popen(["tee", out_fn],
-                                         cwd=path,
-                                         stdin=proc1.stdout)
-                proc1.stdout.close()
-                ret = proc2.wait()
+                ret = run_with_tee(cmd, env, path, out_fn)
             else:
-                ret = subprocess.call(cmd,
-                                      env=env,
-                                      cwd=path,
-                                      stdout=open(out_fn, "w"),
-                                      stderr=open(err_fn, "w"))
+                ret = run_to_files(cmd, env, path, out_fn, err_fn)
 
             if ret == 0:
                 return "success"
@@ -416,7 +435,7 @@ class SlurmLauncher(object):
     '''Job launcher for general slurm'''
     @classmethod
     def is_available(cls):
-        if has_program(["sbatch", "-h"]):
+        if has_program("sbatch"):
             return True
         return False
 
@@ -448,6 +467,7 @@ class SlurmLauncher(object):
 
     def __init__(self, args):
         self.args = args
+        self.base_env = os.environ.copy()
 
     def run(self,
             case,
@@ -481,9 +501,8 @@ class SlurmLauncher(object):
         cmd = srun_cmd + exec_cmd
         cmd = list(map(str, cmd))
 
-        env = dict(os.environ)
-        for k, v in spec["envs"].items():
-            env[k] = str(v)
+        env = self.base_env.copy()
+        env.update((k, str(v)) for k, v in spec["envs"].items())
 
         if self.args["use_batch"]:
             # build sbatch job spec file
@@ -524,7 +543,7 @@ class SlurmLauncher(object):
             if dryrun:
                 return None
 
-            subprocess.call(sbatch_cmd, cwd=path)
+            subprocess.call(sbatch_cmd, cwd=path, close_fds=False)
             # sbatch always success
             return "success"
 
@@ -539,22 +558,9 @@ class SlurmLauncher(object):
             err_fn = os.path.join(path, "STDERR")
 
             if verbose:
-                proc1 = subprocess.Popen(cmd,
-                                         env=env,
-                                         cwd=path,
-                                         stdout=subprocess.PIPE,
-                                         stderr=subprocess.STDOUT)
-                proc2 = subprocess.Popen(["tee", out_fn],
-                                         cwd=path,
-                                         stdin=proc1.stdout)
-                proc1.stdout.close()
-                ret = proc2.wait()
+                ret = run_with_tee(cmd, env, path, out_fn)
             else:
-                ret = subprocess.call(cmd,
-                                      env=env,
-                                      cwd=path,
-                                      stdout=open(out_fn, "w"),
-                                      stderr=open(err_fn, "w"))
+                ret = run_to_files(cmd, env, path, out_fn, err_fn)
 
             if ret == 0:
                 return "success"
@@ -565,20 +571,20 @@ class SlurmLauncher(object):
                 return "failed"
 
 
-PBS_TEMPLATE = '''#PBS -N ${jobname}
-#PBS -l nodes=${nnodes}:ppn=${ppn}
+PBS_TEMPLATE = '''#PBS -N {jobname}
+#PBS -l nodes={nnodes}:ppn={ppn}
 #PBS -j oe
 #PBS -n
 #PBS -V
 #PBS -o STDOUT
-${queue}
-${timeout}
+{queue}
+{timeout}
 
-${envs}
+{envs}
 
 cd $PBS_O_WORKDIR
-mpirun -np ${nprocs} -ppn ${procs_per_node} -machinefile \
-    $PBS_NODEFILE ${iface} ${cmd}
+mpirun -np {nprocs} -ppn {procs_per_node} -machinefile \
+    $PBS_NODEFILE {iface} {cmd}
 '''
 
 
@@ -586,7 +592,7 @@ class PbsLauncher(object):
     '''Job launcher for PBS'''
     @classmethod
     def is_available(cls):
-        if has_program(["qstat", "-h"]):
+        if has_program("qstat"):
             return True
         else:
             return False
@@ -608,6 +614,7 @@ class PbsLauncher(object):
 
     def __init__(self, args):
         self.args = args
+        self.base_env = os.environ.copy()
 
     def run(self,
             case,
@@ -654,8 +661,8 @@ class PbsLauncher(object):
         tplvars["envs"] = envs_str
 
         pbs_file = os.path.join(path, "job_spec.pbs")
-        tpl = string.Template(PBS_TEMPLATE)
-        open(pbs_file, "w").write(tpl.safe_substitute(tplvars))
+        with open(pbs_file, "w") as f:
+            f.write(PBS_TEMPLATE.format_map(tplvars))
 
         if make_script:
             script_file = os.path.join(path, "run.sh")
@@ -665,11 +672,14 @@ class PbsLauncher(object):
         if dryrun:
             return None
 
-        env = dict(os.environ)
-        for k, v in spec["envs"].items():
-            env[k] = str(v)
+        env = self.base_env.copy()
+        env.update((k, str(v)) for k, v in spec["envs"].items())
         cmd = ["qsub", "./job_spec.pbs"]
-        ret = subprocess.call(cmd, env=env, cwd=path, shell=False)
+        ret = subprocess.call(cmd,
+                              env=env,
+                              cwd=path,
+                              shell=False,
+                              close_fds=False)
 
         if ret == 0:
             return "success"
@@ -683,7 +693,7 @@ class BsubLauncher(object):
     '''Job launcher for Sunway TaihuLight'''
     @classmethod
     def is_available(cls):
-        if has_program(["bsub", "-h"]):
+        if has_program("bsub"):
             return True
         return False
 
@@ -722,6 +732,7 @@ class BsubLauncher(object):
 
     def __init__(self, args):
         self.args = args
+        self.base_env = os.environ.copy()
 
     def run(self,
             case,
@@ -758,9 +769,8 @@ class BsubLauncher(object):
         cmd = bsub_cmd + exec_cmd
         cmd = list(map(str, cmd))
 
-        env = dict(os.environ)
-        for k, v in spec["envs"].items():
-            env[k] = str(v)
+        env = self.base_env.copy()
+        env.update((k, str(v)) for k, v in spec["envs"].items())
 
         if make_script:
             make_bash_script(None, spec["envs"], [cmd],
@@ -772,22 +782,9 @@ class BsubLauncher(object):
         err_fn = os.path.join(path, "STDERR")
 
         if verbose:
-            proc1 = subprocess.Popen(cmd,
-                                     env=env,
-                                     cwd=path,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.STDOUT)
-            proc2 = subprocess.Popen(["tee", out_fn],
-                                     cwd=path,
-                                     stdin=proc1.stdout)
-            proc1.stdout.close()
-            ret = proc2.wait()
+            ret = run_with_tee(cmd, env, path, out_fn)
         else:
-            ret = subprocess.call(cmd,
-                                  env=env,
-                                  cwd=path,
-                                  stdout=open(out_fn, "w"),
-                                  stderr=open(err_fn, "w"))
+            ret = run_to_files(cmd, env, path, out_fn, err_fn)
 
         if ret == 0:
             return "success"
@@ -822,7 +819,7 @@ class SimpleProgressReporter(object):
         '''Notify the start of a test case run'''
         self.finished_cases += 1
         completed = float(self.finished_cases) / float(self.total_cases) * 100
-        pretty_case = os.path.relpath(case["fullpath"], project.project_root)
+        pretty_case = case["path"]
         sys.stdout.write("   [%3.0f%%] Run %s ... " % (completed, pretty_case))
         sys.stdout.flush()
 
@@ -846,13 +843,25 @@ def validate_case(case):
     if "contains" in validator:
         for k, v in validator["contains"].items():
             fullpath = os.path.join(case["fullpath"], k)
-            if not os.path.exists(fullpath):
+            # Opening directly saves a stat call for each file
+            try:
+                with open(fullpath) as f:
+                    content = f.read()
+            except (IOError, OSError):
                 return False
-            if not re.search(v, open(fullpath).read()):
+            if not re.search(v, content):
                 return False
     return True
 
 
+def write_stats(stats, fn):
+    '''Write run stats atomically, so readers never see a partial file'''
+    tmp_fn = fn + ".tmp"
+    with open(tmp_fn, "w") as f:
+        json.dump(stats, f, indent=2)
+    os.replace(tmp_fn, fn)
+
+
 def run_project(project,
                 runner,
                 reporter,
@@ -864,58 +873,120 @@ def run_project(project,
                 include=[],
                 skip_finished=False,
                 sleep=0,
-                rerun_failed=False):
-    '''Run a test project'''
+                rerun_failed=False,
+                jobs=1,
+                checkpoint_every=0):
+    '''Run a test project
+
+    With `jobs` > 1, up to `jobs` cases are run concurrently in threads, and
+    each case is reported once it finishes. Verbose runs are always serial
+    since their outputs would interleave.
+
+    With `checkpoint_every` > 0, run stats are also saved after that many
+    cases have been run, so an interrupted run can be resumed with
+    `skip_finished`.
+    '''
     stats = OrderedDict(
         list(zip(["success", "timeout", "failed", "skipped"],
                  [[], [], [], []])))
+    finished = set()
     if skip_finished and project.last_stats:
         stats["success"] = project.last_stats["success"]
+        finished = set(x["path"] for x in stats["success"])
 
-    def has_match(path, matchers):
-        for m in matchers:
-            if fnmatch.fnmatch(path, m):
-                return True
-        return False
+    def compile_matcher(patterns):
+        # All glob patterns are matched at once with a single regex
+        regex = "|".join("(?:%s)" % fnmatch.translate(x) for x in patterns)
+        return re.compile(regex).match
 
-    reporter.project_begin(project)
-    for case in project.itercases():
-        case_path = os.path.relpath(case["fullpath"], project.project_root)
-        case_id = {"test_vector": case["test_vector"], "path": case_path}
-        if exclude and has_match(case_path, exclude):
-            stats["skipped"].append(case_id)
-            reporter.case_begin(project, case)
-            reporter.case_end(project, case, "skipped since excluded")
-            continue
-        elif include and not has_match(case_path, include):
-            stats["skipped"].append(case_id)
-            reporter.case_begin(project, case)
-            reporter.case_end(project, case, "skipped since not included")
-            continue
-        if rerun_failed and validate_case(case):
-            reporter.case_begin(project, case)
-            reporter.case_end(project, case, "skipped since done")
-            continue
-        if skip_finished and case in stats["success"]:
-            reporter.case_begin(project, case)
-            reporter.case_end(project, case, "skipped since in success")
-            continue
-        reporter.case_begin(project, case)
-        result = runner.run(case,
-                            verbose=verbose,
-                            timeout=timeout,
-                            make_script=make_script,
-                            dryrun=dryrun)
+    match_exclude = compile_matcher(exclude)
+    match_include = compile_matcher(include)
+
+    runlog_path = os.path.join(project.project_root, "run_stats.json")
+    done_count = [0]
+
+    def case_done(case, case_id, result):
         reporter.case_end(project, case, "dryrun" if dryrun else result)
         if result:
             stats[result].append(case_id)
-        if sleep:
-            time.sleep(sleep)
-    reporter.project_end(project, stats)
+        done_count[0] += 1
+        if (checkpoint_every and not dryrun
+                and done_count[0] % checkpoint_every == 0):
+            write_stats(stats, runlog_path)
+
+    run_args = {
+        "verbose": verbose,
+        "timeout": timeout,
+        "make_script": make_script,
+        "dryrun": dryrun
+    }
+    parallel = jobs > 1 and not verbose
+    futures = {}
 
-    if not dryrun:
-        runlog_path = os.path.join(project.project_root, "run_stats.json")
-        json.dump(stats, open(runlog_path, "w"), indent=2)
+    reporter.project_begin(project)
+    # Run stats are saved even if a case raises or the run is interrupted, so
+    # cases finished so far can be skipped with `skip_finished`.
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=jobs if parallel else 1) as executor:
+            try:
+                for case in project.itercases():
+                    case_path = case["path"]
+                    case_id = {
+                        "test_vector": case["test_vector"],
+                        "path": case_path
+                    }
+                    if exclude and match_exclude(case_path):
+                        stats["skipped"].append(case_id)
+                        reporter.case_begin(project, case)
+                        reporter.case_end(project, case,
+                                          "skipped since excluded")
+                        continue
+                    elif include and not match_include(case_path):
+                        stats["skipped"].append(case_id)
+                        reporter.case_begin(project, case)
+                        reporter.case_end(project, case,
+                                          "skipped since not included")
+                        continue
+                    if rerun_failed and validate_case(case):
+                        reporter.case_begin(project, case)
+                        reporter.case_end(project, case, "skipped since done")
+                        continue
+                    if case_path in finished:
+                        reporter.case_begin(project, case)
+                        reporter.case_end(project, case,
+                                          "skipped since in success")
+                        continue
+                    if not parallel:
+                        reporter.case_begin(project, case)
+                        result = runner.run(case, **run_args)
+                        case_done(case, case_id, result)
+                    else:
+                        future = executor.submit(runner.run, case, **run_args)
+                        futures[future] = (case, case_id)
+                    if sleep:
+                        time.sleep(sleep)
+                # Reporting happens in this thread only, so no locking is
+                # needed.
+                for future in concurrent.futures.as_completed(futures):
+                    case, case_id = futures.pop(future)
+                    reporter.case_begin(project, case)
+                    case_done(case, case_id, future.result())
+            finally:
+                # On errors, drop cases not started yet and record the running
+                # ones that finish successfully.
+                for future in futures:
+                    future.cancel()
+                for future in concurrent.futures.as_completed(futures):
+                    if future.cancelled() or future.exception() is not None:
+                        continue
+                    case, case_id = futures[future]
+                    reporter.case_begin(project, case)
+                    case_done(case, case_id, future.result())
+        reporter.project_end(project, stats)
+    finally:
+        if not dryrun:
+            write_stats(stats, runlog_path)
 
 
 def main():
@@ -956,6 +1027,15 @@ def main():
                     type=int,
                     default=0,
                     help="Sleep specified seconds between jobs")
+    ag.add_argument("-j",
+                    "--jobs",
+                    type=int,
+                    default=1,
+                    help="Run this many cases concurrently (default: 1)")
+    ag.add_argument("--checkpoint-every",
+                    type=int,
+                    default=0,
+                    help="Save run stats every N cases (default: at end)")
     ag.add_argument("--make-script",
                     action="store_true",
                     help="Generate job script for each case")
@@ -1023,7 +1103,9 @@ def main():
                 include=config.include,
                 skip_finished=config.skip_finished,
                 sleep=config.sleep,
-                rerun_failed=config.rerun_failed)
+                rerun_failed=config.rerun_failed,
+                jobs=config.jobs,
+                checkpoint_every=config.checkpoint_every)
 
 
 if __name__ == "__main__":
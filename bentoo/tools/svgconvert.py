@@ -67,7 +67,8 @@ def svgconvert(svgfile, outfile):
     width = root.attrib["width"]
     height = root.attrib["height"]
     rasterize_fn = os.path.join("/tmp", "svgconvert-%d.js" % os.getpid())
-    file(rasterize_fn, "w").write(rasterize_js)
+    with open(rasterize_fn, "w") as f:
+        f.write(rasterize_js)
     try:
         cmd = ["phantomjs", rasterize_fn, svgfile, outfile,
                "%s*%s" % (width, height)]
@@ -489,7 +489,8 @@ def view_data(ref_db,
     if sql:
         real_sql = "SELECT * FROM ({}) ORDER BY abs_seq".format(sql)
     data = pandas.read_sql_query(real_sql, conn)
-    spec_text = file(spec_file).read()
+    with open(spec_file) as f:
+        spec_text = f.read()
     if os.path.splitext(spec_file)[-1] == ".json":
         spec_text = re.sub(r"//.*", "", spec_text)
     spec = loads(spec_text)
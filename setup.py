@@ -8,6 +8,7 @@ setup(name="bentoo",
       "Benchmark Tools for Reproducible (Parallel) Performance Evaluation",
       version="0.25.2",
       packages=find_packages(exclude=("tests",)),
+      python_requires=">=3.8",
       entry_points={
           "console_scripts": [
               "bentoo-generator = bentoo.tools.generator:main",
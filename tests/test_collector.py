@@ -0,0 +1,71 @@
+# coding: utf-8
+
+import math
+import os
+import shutil
+import tempfile
+import unittest
+import bentoo.tools.collector as collector
+
+
+class TestCollector(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_jasmin4_values(self):
+        # Each case as: (token, type, (value, percent))
+        cases = [("12", int, (12, None)),
+                 ("0.9065", float, (0.9065, None)),
+                 ("1e3", float, (1000.0, None)),
+                 ("-2.5E-2", float, (-0.025, None)),
+                 ("0.86(95.14%)", float, (0.86, 0.9514)),
+                 ("1(2%)", int, (1.0, 0.02)),
+                 ("-0.5(-3%)", float, (-0.5, -0.03)),
+                 ("95.14%", float, (0.9514, None)),
+                 ("12%", int, (0.12, None)),
+                 ("0.86(95.14%)", str, (0.86, 0.9514)),
+                 ("name", str, ("name", None)),
+                 ("abc%", str, ("abc%", None)),
+                 ("", float, (None, None)),
+                 ("", str, (None, None))]
+        tokens = [x[0] for x in cases]
+        types = [x[1] for x in cases]
+        result = collector.parse_jasmin4_values(tokens, types)
+        self.assertEqual(len(result), len(cases))
+        for (token, t, expect), get in zip(cases, result):
+            for e, g in zip(expect, get):
+                if isinstance(e, float):
+                    self.assertAlmostEqual(g, e, places=12, msg=token)
+                else:
+                    self.assertEqual(g, e, msg=token)
+                    self.assertEqual(type(g), type(e), msg=token)
+
+    def test_parse_jasmin4_values_nan(self):
+        result = collector.parse_jasmin4_values(["nan", "nan(5%)"],
+                                                [float, float])
+        self.assertTrue(math.isnan(result[0][0]))
+        self.assertTrue(math.isnan(result[1][0]))
+        self.assertAlmostEqual(result[1][1], 0.05)
+
+    def test_parse_jasmin4_values_invalid(self):
+        # Fields neither of the column type nor in percent forms
+        for token, t in [("abc", float), ("x(5%)", float), ("(5%)", float),
+                         ("1.5", int)]:
+            with self.assertRaises(ValueError):
+                collector.parse_jasmin4_values([token], [t])
+
+    def test_pandas_serializer_csv(self):
+        fn = os.path.join(self.tmpdir, "result.csv")
+        serializer = collector.PandasSerializer(fn, {"format": "csv"})
+        rows = [("t0", 1, 0.5), ("a,b", 2, None), ('q"x', 3, 1e-07)]
+        serializer.serialize(iter(rows), ["TimerName", "ProcId", "Time"],
+                             [str, int, float])
+        with open(fn, "rb") as f:
+            content = f.read()
+        # The same bytes as pandas.DataFrame.to_csv, with "\n" line endings
+        expect = (b'TimerName,ProcId,Time\nt0,1,0.5\n"a,b",2,\n'
+                  b'"q""x",3,1e-07\n')
+        self.assertEqual(content, expect)
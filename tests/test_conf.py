@@ -0,0 +1,39 @@
+# coding: utf-8
+
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+import bentoo.common.conf as conf
+
+
+class TestConf(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load_conf_comments(self):
+        content = '''{
+    // the project url
+    "url": "http://example.com/path//x", // trailing comment
+    "quoted": "say \\"//not a comment\\"",
+    "backslash": "\\\\", // comment after an escaped backslash
+    "list": [1, 2] // done
+}
+'''
+        expect = {
+            "url": "http://example.com/path//x",
+            "quoted": 'say "//not a comment"',
+            "backslash": "\\",
+            "list": [1, 2]
+        }
+        # Small files are read directly, large ones are mmapped.
+        for padding in (0, mmap.PAGESIZE):
+            fn = os.path.join(self.tmpdir, "conf.jsonc")
+            with open(fn, "w") as f:
+                f.write(content)
+                f.write("// padding\n" * (padding // 10))
+            self.assertEqual(conf.load_conf(fn), expect)
@@ -0,0 +1,42 @@
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+import bentoo.tools.confreader as confreader
+
+
+class TestConfReader(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def convert(self, content, ext):
+        src_file = os.path.join(self.tmpdir, "src" + ext)
+        with open(src_file, "w") as src:
+            src.write(content)
+        dst_file = os.path.join(self.tmpdir, "dst.yml")
+        with open(src_file) as src, open(dst_file, "w") as dst:
+            confreader.dump(confreader.load(src), dst)
+        with open(dst_file) as dst:
+            whole = dst.read()
+        confreader.convert_stream(src_file, dst_file)
+        with open(dst_file) as dst:
+            streamed = dst.read()
+        return whole, streamed
+
+    def test_stream_same_as_whole(self):
+        # Each case as: (content, file extension)
+        cases = [('{"a": 1, "b": {"x": [1, 2.5, "s"], "y": null}, "c": "t"}',
+                  ".json"),
+                 ('{"d": [{"p": 1}, {"q": [true, false]}], "e": {}, "f": []}',
+                  ".json"),
+                 ('{"only": "one"}', ".json"),
+                 ('{}', ".json"),
+                 ('a: 1\nb:\n  x: [1, 2]\n  y: text\n', ".yml")]
+        for content, ext in cases:
+            whole, streamed = self.convert(content, ext)
+            self.assertEqual(streamed, whole)
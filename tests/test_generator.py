@@ -0,0 +1,37 @@
+# coding: utf-8
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import bentoo.tools.generator as generator
+
+
+class TestGenerator(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_json_streamed(self):
+        # Each case as: (obj, items)
+        cases = [({"name": "p", "info": {"n": [1, 2]}}, [{"path": "a/b"},
+                                                         [1, "x"], {}, 3]),
+                 ({"name": "p"}, []),
+                 ({}, [{"path": "a"}]),
+                 ({}, [])]
+        streamed_fn = os.path.join(self.tmpdir, "streamed.json")
+        whole_fn = os.path.join(self.tmpdir, "whole.json")
+        for obj, items in cases:
+            generator.write_json_streamed(obj, "test_cases", iter(items),
+                                          streamed_fn)
+            expect = dict(obj)
+            expect["test_cases"] = items
+            with open(streamed_fn) as f:
+                self.assertEqual(json.load(f), expect)
+            # The same bytes as serializing the whole object at once
+            generator.write_json(expect, whole_fn)
+            with open(streamed_fn, "rb") as f1, open(whole_fn, "rb") as f2:
+                self.assertEqual(f1.read(), f2.read())
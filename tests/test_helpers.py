@@ -1,7 +1,7 @@
 # coding: utf-8
 
 import unittest
-import bentoo.common.helpers2 as helpers
+import bentoo.common.helpers as helpers
 
 
 class TestHelpers2(unittest.TestCase):
@@ -0,0 +1,81 @@
+# coding: utf-8
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import bentoo.tools.metric as metric
+
+# Rows as (TimerName, A, B, C), with zero and missing values
+ROWS = [("t0", 3, 2.0, 1.5), ("t1", 0, 0.0, None), ("t2", -7, 4.0, 0.0),
+        ("t3", 5, None, 2.0), ("t4", 1, 1e200, -0.5)]
+
+
+class TestMetric(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.input_db = os.path.join(self.tmpdir, "input.db")
+        conn = sqlite3.connect(self.input_db)
+        conn.execute("CREATE TABLE result (\"TimerName\" TEXT, "
+                     "\"A\" INTEGER, \"B\" REAL, \"C\" REAL)")
+        conn.executemany("INSERT INTO result VALUES (?, ?, ?, ?)", ROWS)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def eval_rows(self, formula):
+        code = metric.compile_formula(formula)
+        return [
+            metric.eval_formula(code, dict(zip("ABC", row[1:])))
+            for row in ROWS
+        ]
+
+    def test_formula_to_sql(self):
+        formulas = [
+            "A + B", "A - C * 2", "-A * (B - C)", "A / B", "A / C", "7 / A",
+            "A / 2", "(A + 1) / (B - 2.0)", "B * B * 1e200"
+        ]
+        columns = {"A": "A", "B": "B", "C": "C"}
+        conn = sqlite3.connect(self.input_db)
+        for formula in formulas:
+            sql = metric.formula_to_sql(formula, columns)
+            self.assertIsNotNone(sql, formula)
+            sql = "SELECT IFNULL({0}, 0) FROM result ORDER BY rowid".format(
+                sql)
+            get = [x[0] for x in conn.execute(sql)]
+            self.assertEqual(get, self.eval_rows(formula), formula)
+        conn.close()
+
+    def test_formula_to_sql_unsupported(self):
+        columns = {"A": "A", "B": "B"}
+        for formula in ["A ** 2", "A // 2", "A % 2", "max(A, B)", "Nope + 1",
+                        "A +", "'x' + A", "A < B"]:
+            self.assertIsNone(metric.formula_to_sql(formula, columns),
+                              formula)
+
+    def test_compute_metrics(self):
+        # Results shall be the same as evaluating each row in python, no
+        # matter the metrics are computed by sqlite, numpy or row by row.
+        specs = [["A / C", "A * B - C"],
+                 ["A ** 2 / C", "A // 2", "B * B * 1e200", "A % C"],
+                 ["max(A, C)", "A / B"]]
+        for i, formulas in enumerate(specs):
+            spec = {
+                "data": ["A", "B", "C"],
+                "metrics": [{
+                    "name": "m%d" % j,
+                    "type": float,
+                    "formula": x
+                } for j, x in enumerate(formulas)]
+            }
+            output_db = os.path.join(self.tmpdir, "output%d.db" % i)
+            metric.compute_metrics(self.input_db, output_db, spec)
+            conn = sqlite3.connect(output_db)
+            get = list(conn.execute("SELECT * FROM result ORDER BY rowid"))
+            conn.close()
+            values = zip(*map(self.eval_rows, formulas))
+            expect = [(row[0], ) + x for row, x in zip(ROWS, values)]
+            self.assertEqual(get, expect, formulas)